@@ -1,8 +1,10 @@
 import streamlit as st
-import requests
-import json
 import os
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.async_stream import stream_deltas, StreamError, warm_up
+from chat_common.render import StreamRenderer
 from datetime import datetime
 from utils import get_user, create_user, verify_password, save_message, get_messages
 import emoji
@@ -19,6 +21,9 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com "
 YOUR_SITE_NAME = "MyAIApp"
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up("https://openrouter.ai/api/v1/chat/completions")
+
 # --- Session State Setup ---
 if 'logged_in' not in st.session_state:
     st.session_state.logged_in = False
@@ -105,25 +110,11 @@ def stream_ai_response(user_message):
     }
 
     def generate():
-        with requests.post(url, headers=headers, json=data, stream=True) as response:
-            try:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        decoded_line = line.decode("utf-8").strip()
-                        if decoded_line.startswith("data: "):
-                            json_data = decoded_line[6:]
-                            if json_data == "[DONE]":
-                                break
-                            try:
-                                chunk = json.loads(json_data)
-                                delta = chunk["choices"][0]["delta"].get("content")
-                                if delta:
-                                    yield delta
-                            except json.JSONDecodeError:
-                                continue
-            except requests.exceptions.RequestException as e:
-                yield f"\n\n⚠️ Error: {e}"
+        try:
+            for delta in stream_deltas(data, url=url, headers=headers):
+                yield delta
+        except StreamError as e:
+            yield f"\n\n⚠️ Error: {e}"
 
     return generate()
 
@@ -189,22 +180,17 @@ def chat_page():
 
             # Get AI response
             with st.spinner("🧠 Thinking..."):
-                full_response = ""
                 message_placeholder = st.empty()
-                for chunk in stream_ai_response(user_input):
-                    full_response += chunk
-                    message_placeholder.markdown(f"""
-                    <div class="stChatMessage stChatMessageAssistant">
-                        <strong>Assistant:</strong> {full_response}▌
-                    </div>
-                    """, unsafe_allow_html=True)
-
-                # Final update
-                message_placeholder.markdown(f"""
+                renderer = StreamRenderer(message_placeholder, template="""
                 <div class="stChatMessage stChatMessageAssistant">
-                    <strong>Assistant:</strong> {full_response}
+                    <strong>Assistant:</strong> {text}
                 </div>
                 """, unsafe_allow_html=True)
+                for chunk in stream_ai_response(user_input):
+                    renderer.write(chunk)
+
+                # Final update
+                full_response = renderer.finish()
 
             # Save AI response
             st.session_state.messages.append({"text": full_response, "is_user": False})
@@ -4,6 +4,10 @@ from pymongo import MongoClient
 from passlib.hash import bcrypt
 import os
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.indexes import ensure_indexes
+from chat_common.write_behind import get_write_buffer
 
 load_dotenv()
 
@@ -13,6 +17,12 @@ db = client.chatbot_db
 users_collection = db.users
 messages_collection = db.messages
 
+# Create missing indexes once per process
+ensure_indexes(db, ["users", "messages"])
+
+# Messages are queued and written in batches off the request path
+message_writes = get_write_buffer(messages_collection)
+
 def get_user(email):
     return users_collection.find_one({"email": email})
 
@@ -30,7 +40,7 @@ def verify_password(email, password):
     return bcrypt.verify(password, user["password"])
 
 def save_message(email, message, is_user=True):
-    messages_collection.insert_one({
+    message_writes.insert({
         "email": email,
         "text": message,
         "is_user": is_user,
@@ -38,4 +48,6 @@ def save_message(email, message, is_user=True):
     })
 
 def get_messages(email):
+    # Include messages still waiting in the write buffer
+    message_writes.flush()
     return list(messages_collection.find({"email": email}, sort=[("timestamp", 1)]))
\ No newline at end of file
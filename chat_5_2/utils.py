@@ -5,6 +5,10 @@ import os
 import uuid
 from datetime import datetime
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.indexes import ensure_indexes
+from chat_common.cache import MemoryCache
 
 load_dotenv()
 
@@ -14,6 +18,9 @@ db = client.chatbot_db_2
 users_collection = db.users
 chat_sessions_collection = db.chat_sessions
 
+# Create missing indexes once per process
+ensure_indexes(db, ["users", "chat_sessions"])
+
 def get_user(email):
     return users_collection.find_one({"email": email})
 
@@ -49,11 +56,58 @@ def get_all_chats(email):
 def get_chat_by_id(chat_id):
     return chat_sessions_collection.find_one({"chat_id": chat_id})
 
+# Messages of recently opened chats, kept current by the write functions below
+recent_chat_messages = MemoryCache(max_entries=32, ttl_seconds=300)
+
+def get_chat_summaries(email):
+    """Sidebar listing: chat_id, title, timestamp and message count, without the messages themselves"""
+    return list(chat_sessions_collection.aggregate([
+        {"$match": {"email": email}},
+        {"$sort": {"timestamp": -1}},
+        {"$project": {
+            "_id": 0, "chat_id": 1, "title": 1, "timestamp": 1,
+            "message_count": {"$size": {"$ifNull": ["$messages", []]}}
+        }}
+    ]))
+
+def get_chat_messages(chat_id):
+    """Load the messages of the chat being opened"""
+    messages = recent_chat_messages.get(chat_id)
+    if messages is None:
+        chat = chat_sessions_collection.find_one({"chat_id": chat_id}, {"_id": 0, "messages": 1})
+        messages = chat.get("messages", []) if chat else []
+        recent_chat_messages.set(chat_id, messages)
+    # The caller appends to its list; keep the cached one separate
+    return list(messages)
+
 def update_chat_messages(chat_id, messages):
+    """Rewrite the whole history; append_chat_messages is the per-turn path"""
     chat_sessions_collection.update_one(
         {"chat_id": chat_id},
         {"$set": {"messages": messages}}
     )
+    recent_chat_messages.set(chat_id, list(messages))
+
+def append_chat_messages(chat_id, new_messages, seq):
+    """Push new messages, numbered from seq, only if the chat still holds exactly seq messages.
+
+    Returns False when another writer got there first, so the caller can
+    reload the stored messages and append again at their length.
+    """
+    query = {"chat_id": chat_id, f"messages.{seq}": {"$exists": False}}
+    if seq:
+        query[f"messages.{seq - 1}"] = {"$exists": True}
+    pushed = [{**m, "seq": seq + i} for i, m in enumerate(new_messages)]
+    result = chat_sessions_collection.update_one(query, {"$push": {"messages": {"$each": pushed}}})
+    if result.modified_count != 1:
+        recent_chat_messages.delete(chat_id)
+        return False
+    cached = recent_chat_messages.get(chat_id)
+    if cached is not None and len(cached) == seq:
+        recent_chat_messages.set(chat_id, cached + pushed)
+    else:
+        recent_chat_messages.delete(chat_id)
+    return True
 
 def update_chat_title(chat_id, new_title):
     chat_sessions_collection.update_one(
@@ -61,6 +115,13 @@ def update_chat_title(chat_id, new_title):
         {"$set": {"title": new_title}}
     )
 
+def set_generated_title(chat_id, title):
+    """Set an auto-generated title unless the chat has been renamed in the meantime"""
+    chat_sessions_collection.update_one(
+        {"chat_id": chat_id, "title": "New Chat"},
+        {"$set": {"title": title}}
+    )
+
 def add_tag_to_chat(chat_id, tag):
     chat_sessions_collection.update_one(
         {"chat_id": chat_id},
@@ -68,4 +129,5 @@ def add_tag_to_chat(chat_id, tag):
     )
 
 def delete_chat(chat_id):
-    chat_sessions_collection.delete_one({"chat_id": chat_id})
\ No newline at end of file
+    chat_sessions_collection.delete_one({"chat_id": chat_id})
+    recent_chat_messages.delete(chat_id)
\ No newline at end of file
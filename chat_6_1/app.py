@@ -1,14 +1,27 @@
 import streamlit as st
-import requests
 import json
 import os
 from dotenv import load_dotenv
-from datetime import datetime
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.openrouter import complete, completion_calls
+from chat_common.async_stream import stream_chunks, chunk_content, StreamError, warm_up
+from chat_common.context import build_context
+from chat_common.tokens import UsageMeter
+from chat_common.resilience import snapshot as provider_metrics
+from chat_common import router
+from chat_common.ratelimit import get_rate_limiter, RateLimitedError, EXPECTED_COMPLETION_TOKENS
+from chat_common.memory import with_summary, maybe_refresh_summary
+from chat_common.cache import get_cache, cached_stream, cache_key
+from chat_common.semantic_cache import get_semantic_cache, semantic_stream
+from chat_common.titles import schedule_title, pop_finished, extract_title, TITLE_MIN_SCORE
 from utils import (
     get_user, create_user, verify_password,
-    create_chat_session, get_all_chats, get_chat_by_id,
-    update_chat_messages, update_chat_title, delete_chat,
-    add_token_usage_record
+    create_chat_session, get_chat_summaries, get_chat_messages,
+    append_chat_messages, update_chat_title, delete_chat,
+    add_token_usage_record, response_cache_collection, rate_limits_collection,
+    get_chat_summary, update_chat_summary, set_generated_title, search_chats,
+    semantic_search_chats
 )
 
 # Load environment variables
@@ -29,6 +42,17 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com"
 YOUR_SITE_NAME = "MyAIApp"
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up(api_url)
+
+# Opt-in exact-match response cache (RESPONSE_CACHE=memory|disk|mongo)
+response_cache = get_cache(collection=response_cache_collection)
+# Opt-in cache that also serves paraphrases of earlier prompts (SEMANTIC_CACHE=on)
+semantic_cache = get_semantic_cache()
+
+# Per-user and global request/token budgets, shared across server processes through Mongo
+rate_limiter = get_rate_limiter(rate_limits_collection)
+
 # Set page config
 st.set_page_config(page_title="🤖 AI Chatbot", layout="wide")
 
@@ -52,6 +76,8 @@ if 'current_chat' not in st.session_state:
     st.session_state.current_chat = None
 if 'messages' not in st.session_state:
     st.session_state.messages = []
+if 'search_page' not in st.session_state:
+    st.session_state.search_page = 0
 if 'dark_mode' not in st.session_state:
     st.session_state.dark_mode = True
 if 'token_usage' not in st.session_state:
@@ -70,58 +96,87 @@ def stream_ai_response(user_message):
         "HTTP-Referer": YOUR_SITE_URL,
         "X-Title": YOUR_SITE_NAME
     }
+    # Older turns are sent as a rolling summary, refreshed in the background
+    chat_id = st.session_state.current_chat
+    summary, summarized_count = get_chat_summary(chat_id)
+    maybe_refresh_summary(chat_id, list(st.session_state.messages), summary, summarized_count,
+                          save=update_chat_summary, url=url, headers=headers)
+    pinned, history = with_summary(st.session_state.messages, summary, summarized_count)
+
+    # Keep the prompt within the token budget instead of resending the whole history
+    messages, context_stats = build_context("You are a helpful assistant.", history, pinned=pinned)
+    st.session_state.context_stats = context_stats
+
+    # router.MODELS (OPENROUTER_MODELS) lists the candidates; the router picks among them per request
     data = {
-        "model": "deepseek/deepseek-r1-0528:free",
-        "messages": [
-            {"role": "system", "content": "You are a helpful assistant."},
-            *[{"role": msg["role"], "content": msg["content"]} for msg in st.session_state.messages]
-        ],
+        "model": router.MODELS[0],
+        "messages": messages,
         "temperature": 0.7,
         "stream": True
     }
 
     def generate():
-        total_prompt_tokens = 0
-        total_completion_tokens = 0
-
-        with requests.post(url, headers=headers, json=data, stream=True) as response:
-            try:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        decoded_line = line.decode("utf-8").strip()
-                        if decoded_line.startswith("data: "):
-                            json_data = decoded_line[6:]
-                            if json_data == "[DONE]":
-                                break
-                            try:
-                                chunk = json.loads(json_data)
-                                delta = chunk["choices"][0]["delta"].get("content")
-                                tokens = chunk.get("usage", {})
-
-                                total_prompt_tokens += tokens.get("prompt_tokens", 0)
-                                total_completion_tokens += tokens.get("completion_tokens", 0)
-
-                                if delta:
-                                    yield delta
-
-                            except json.JSONDecodeError:
-                                continue
-
-                # Save final token usage
-                st.session_state.token_usage = {
-                    "prompt_tokens": total_prompt_tokens,
-                    "completion_tokens": total_completion_tokens,
-                    "total_tokens": total_prompt_tokens + total_completion_tokens
-                }
-
-            except requests.exceptions.RequestException as e:
-                yield f"\n\n⚠️ Error: {e}"
+        meters = []
+
+        def upstream():
+            # Checked only when the provider is actually called, so cache hits are free
+            rate_limiter.acquire(st.session_state.email, context_stats["prompt_tokens"] + EXPECTED_COMPLETION_TOKENS)
+            meter = UsageMeter(messages)
+            meters.append(meter)
+            for chunk in stream_chunks(data, url=url, headers=headers, models=router.MODELS):
+                meter.add_usage(chunk.get("usage"))
+
+                delta = chunk_content(chunk)
+                if delta:
+                    meter.add_delta(delta)
+                    yield delta
+
+        try:
+            # A cache hit is replayed as a stream and costs no tokens
+            yield from semantic_stream(semantic_cache, data, lambda: cached_stream(response_cache, data, upstream))
+        except StreamError as e:
+            yield f"\n\n⚠️ Error: {e}"
+        except RateLimitedError as e:
+            yield f"⏳ {e}"
+
+        # Save final token usage (provider-reported when available, local counts otherwise)
+        if meters:
+            st.session_state.token_usage = meters[0].totals()
+        else:
+            st.session_state.token_usage = {
+                "prompt_tokens": 0,
+                "completion_tokens": 0,
+                "total_tokens": 0,
+                "estimated": False
+            }
 
     return generate()
 
+# --- Message Persistence ---
+APPEND_RETRIES = 3
+
+def persist_last_message():
+    """Append the newest message in O(1); if another tab wrote first, add it after what is stored now"""
+    chat_id = st.session_state.current_chat
+    message = st.session_state.messages[-1]
+    seq = len(st.session_state.messages) - 1
+    for _ in range(APPEND_RETRIES):
+        if append_chat_messages(chat_id, [message], seq):
+            return
+        # Keep the other writer's messages rather than overwriting them with this tab's copy
+        stored = get_chat_messages(chat_id)
+        print(f"Chat {chat_id} changed elsewhere; appending after its {len(stored)} stored messages")
+        st.session_state.messages = stored + [message]
+        seq = len(stored)
+    print(f"Chat {chat_id} kept changing; the last message was not saved")
+
 # --- Auto Title Generation ---
 def generate_chat_title(first_message):
+    # A local keyword title is good enough for most first messages; only ask the model when it is weak
+    local_title, score = extract_title(first_message)
+    if score >= TITLE_MIN_SCORE:
+        return local_title
+
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
         "Content-Type": "application/json",
@@ -139,14 +194,14 @@ def generate_chat_title(first_message):
         "max_tokens": 30
     }
 
+    def request_title():
+        return complete(data, url=api_url, headers=headers)
+
     try:
-        response = requests.post(api_url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content'].strip()
+        return completion_calls.call(cache_key(data), request_title)
     except Exception as e:
         print(f"Auto-title generation failed: {e}")
-        return "New Chat"
+        return local_title or "New Chat"
 
 # --- Login Page ---
 def login_page():
@@ -157,15 +212,15 @@ def login_page():
         if verify_password(email, password):
             st.session_state.logged_in = True
             st.session_state.email = email
-            st.session_state.chats = get_all_chats(email)
+            st.session_state.chats = get_chat_summaries(email)
             if st.session_state.chats:
                 latest_chat = st.session_state.chats[0]
                 st.session_state.current_chat = latest_chat["chat_id"]
-                st.session_state.messages = latest_chat.get("messages", [])
+                st.session_state.messages = get_chat_messages(latest_chat["chat_id"])
             else:
                 chat_id, title = create_chat_session(email)
                 st.session_state.current_chat = chat_id
-                st.session_state.chats = get_all_chats(email)
+                st.session_state.chats = get_chat_summaries(email)
                 st.session_state.messages = []
             st.rerun()
         else:
@@ -186,17 +241,51 @@ def register_page():
 def chat_page():
     with st.sidebar:
         st.subheader("💬 Your Chats")
+
+        # Pick up titles finished in the background since the last run
+        if pop_finished(st.session_state.email):
+            st.session_state.chats = get_chat_summaries(st.session_state.email)
+
+        # Search titles and messages of all this user's chats
+        search_query = st.text_input("🔍 Search chats", placeholder="Search titles and messages")
+        by_meaning = st.checkbox("🧠 Match meaning", help="Find chats about the same thing, even in other words")
+        if search_query.strip():
+            if st.session_state.get("search_for") != (search_query, by_meaning):
+                st.session_state.search_for = (search_query, by_meaning)
+                st.session_state.search_page = 0
+            search = semantic_search_chats if by_meaning else search_chats
+            results, has_more = search(st.session_state.email, search_query, page=st.session_state.search_page)
+            if not results:
+                st.caption("No matching chats")
+            for result in results:
+                if st.button(result["title"], key=f"hit_{result['chat_id']}", use_container_width=True):
+                    st.session_state.current_chat = result["chat_id"]
+                    st.session_state.messages = get_chat_messages(result["chat_id"])
+                    st.rerun()
+                st.caption(result["snippet"])
+            nav = st.columns(2)
+            with nav[0]:
+                if st.session_state.search_page > 0 and st.button("← Prev", key="search_prev"):
+                    st.session_state.search_page -= 1
+                    st.rerun()
+            with nav[1]:
+                if has_more and st.button("Next →", key="search_next"):
+                    st.session_state.search_page += 1
+                    st.rerun()
+            st.markdown("---")
+
         if st.button("➕ New Chat"):
+            previous_chat = st.session_state.current_chat
             chat_id, title = create_chat_session(st.session_state.email)
             st.session_state.chats = []
             st.session_state.current_chat = chat_id
-            st.session_state.chats = get_all_chats(st.session_state.email)
+            st.session_state.chats = get_chat_summaries(st.session_state.email)
 
             if st.session_state.messages:
+                # Title the chat being left without blocking the page; it shows "New Chat" until then
                 first_message = st.session_state.messages[0]["content"]
-                new_title = generate_chat_title(first_message)
-                update_chat_title(chat_id, new_title)
-                st.session_state.chats = get_all_chats(st.session_state.email)
+                schedule_title(previous_chat, first_message, generate_chat_title, set_generated_title,
+                               owner=st.session_state.email)
 
             st.rerun()
 
@@ -204,20 +293,27 @@ def chat_page():
             chat_id = chat["chat_id"]
             current_title = chat["title"]
 
-            cols = st.columns([0.8, 0.2])
+            cols = st.columns([0.7, 0.15, 0.15])
             with cols[0]:
                 new_title = st.text_input("Rename", value=current_title, key=f"rename_{chat_id}", label_visibility="collapsed")
             if new_title != current_title:
                 update_chat_title(chat_id, new_title)
                 st.rerun()
 
+            # Messages are only loaded for the chat being opened
             with cols[1]:
+                if st.button("📂", key=f"open_{chat_id}", help=f"{chat.get('message_count', 0)} messages"):
+                    st.session_state.current_chat = chat_id
+                    st.session_state.messages = get_chat_messages(chat_id)
+                    st.rerun()
+
+            with cols[2]:
                 if st.button("🗑️", key=f"del_{chat_id}"):
                     delete_chat(chat_id)
-                    st.session_state.chats = get_all_chats(st.session_state.email)
+                    st.session_state.chats = get_chat_summaries(st.session_state.email)
                     if st.session_state.chats:
                         st.session_state.current_chat = st.session_state.chats[0]["chat_id"]
-                        st.session_state.messages = st.session_state.chats[0].get("messages", [])
+                        st.session_state.messages = get_chat_messages(st.session_state.chats[0]["chat_id"])
                     else:
                         st.session_state.current_chat = None
                         st.session_state.messages = []
@@ -240,6 +336,14 @@ def chat_page():
         st.markdown("---")
         st.markdown("🧠 Powered by DeepSeek via OpenRouter")
 
+        # Provider health and latency seen by this server process
+        with st.expander("📈 Provider metrics"):
+            st.json(provider_metrics())
+            st.json(router.snapshot())
+            if "context_stats" in st.session_state:
+                st.caption("Context of the last request")
+                st.json(st.session_state.context_stats)
+
         # Export options
         if st.session_state.current_chat and st.session_state.messages:
             chat_title = next((c["title"] for c in st.session_state.chats if c["chat_id"] == st.session_state.current_chat), "Chat")
@@ -275,29 +379,27 @@ def chat_page():
     # Handle new input
     if prompt := st.chat_input("Ask something..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
-        update_chat_messages(st.session_state.current_chat, st.session_state.messages)
+        persist_last_message()
 
         with st.chat_message("user"):
             st.markdown(prompt)
 
         with st.chat_message("assistant"):
             with st.spinner("🧠 Thinking..."):
-                full_response = ""
-
-                for chunk in stream_ai_response(prompt):
-                    full_response += chunk
+                full_response = "".join(stream_ai_response(prompt))
 
             st.markdown(full_response)
 
         st.session_state.messages.append({"role": "assistant", "content": full_response})
-        update_chat_messages(st.session_state.current_chat, st.session_state.messages)
+        persist_last_message()
 
         # Log token usage
         usage = st.session_state.token_usage
         add_token_usage_record(
             email=st.session_state.email,
             prompt_tokens=usage["prompt_tokens"],
-            completion_tokens=usage["completion_tokens"]
+            completion_tokens=usage["completion_tokens"],
+            estimated=usage.get("estimated", False)
         )
 
 # --- Routing ---
@@ -1,13 +1,18 @@
 import streamlit as st
-import requests
 import json
 import os
 from dotenv import load_dotenv
-from datetime import datetime
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.openrouter import complete, completion_calls
+from chat_common.async_stream import stream_deltas, StreamError, warm_up
+from chat_common.render import StreamRenderer
+from chat_common.cache import cache_key
+from chat_common.titles import schedule_title, pop_finished, extract_title, TITLE_MIN_SCORE
 from utils import (
     get_user, create_user, verify_password,
-    create_chat_session, get_all_chats, get_chat_by_id,
-    update_chat_messages, update_chat_title, delete_chat
+    create_chat_session, get_chat_summaries, get_chat_messages,
+    append_chat_messages, update_chat_title, delete_chat, set_generated_title
 )
 
 # Load environment variables
@@ -28,6 +33,9 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com "
 YOUR_SITE_NAME = "MyAIApp"
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up(api_url)
+
 # Set page config
 st.set_page_config(page_title="🤖 AI Chatbot", layout="wide")
 
@@ -76,29 +84,38 @@ def stream_ai_response(user_message):
 
     def generate():
         try:
-            with requests.post(url, headers=headers, json=data, stream=True) as response:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        decoded_line = line.decode("utf-8").strip()
-                        if decoded_line.startswith("data: "):
-                            json_data = decoded_line[6:]
-                            if json_data == "[DONE]":
-                                break
-                            try:
-                                chunk = json.loads(json_data)
-                                delta = chunk["choices"][0]["delta"].get("content")
-                                if delta:
-                                    yield delta
-                            except json.JSONDecodeError:
-                                continue
-        except requests.exceptions.RequestException as e:
+            for delta in stream_deltas(data, url=url, headers=headers):
+                yield delta
+        except StreamError as e:
             yield f"\n\n⚠️ Error: {e}"
 
     return generate()
 
+# --- Message Persistence ---
+APPEND_RETRIES = 3
+
+def persist_last_message():
+    """Append the newest message in O(1); if another tab wrote first, add it after what is stored now"""
+    chat_id = st.session_state.current_chat
+    message = st.session_state.messages[-1]
+    seq = len(st.session_state.messages) - 1
+    for _ in range(APPEND_RETRIES):
+        if append_chat_messages(chat_id, [message], seq):
+            return
+        # Keep the other writer's messages rather than overwriting them with this tab's copy
+        stored = get_chat_messages(chat_id)
+        print(f"Chat {chat_id} changed elsewhere; appending after its {len(stored)} stored messages")
+        st.session_state.messages = stored + [message]
+        seq = len(stored)
+    print(f"Chat {chat_id} kept changing; the last message was not saved")
+
 # --- Auto Title Generation ---
 def generate_chat_title(first_message):
+    # A local keyword title is good enough for most first messages; only ask the model when it is weak
+    local_title, score = extract_title(first_message)
+    if score >= TITLE_MIN_SCORE:
+        return local_title
+
     url = api_url
     headers = {
         "Authorization": f"Bearer {OPENROUTER_API_KEY}",
@@ -115,14 +132,14 @@ def generate_chat_title(first_message):
         "temperature": 0.3,
         "max_tokens": 30
     }
+    def request_title():
+        return complete(data, url=url, headers=headers)
+
     try:
-        response = requests.post(url, headers=headers, json=data)
-        response.raise_for_status()
-        result = response.json()
-        return result['choices'][0]['message']['content'].strip()
+        return completion_calls.call(cache_key(data), request_title)
     except Exception as e:
         print(f"Auto-title generation failed: {e}")
-        return "New Chat"
+        return local_title or "New Chat"
 
 # --- Login Page ---
 def login_page():
@@ -133,15 +150,15 @@ def login_page():
         if verify_password(email, password):
             st.session_state.logged_in = True
             st.session_state.email = email
-            st.session_state.chats = get_all_chats(email)
+            st.session_state.chats = get_chat_summaries(email)
             if st.session_state.chats:
                 latest_chat = st.session_state.chats[0]
                 st.session_state.current_chat = latest_chat["chat_id"]
-                st.session_state.messages = latest_chat.get("messages", [])
+                st.session_state.messages = get_chat_messages(latest_chat["chat_id"])
             else:
                 chat_id, title = create_chat_session(email)
                 st.session_state.current_chat = chat_id
-                st.session_state.chats = get_all_chats(email)
+                st.session_state.chats = get_chat_summaries(email)
                 st.session_state.messages = []
 
             st.rerun()
@@ -164,17 +181,22 @@ def chat_page():
     with st.sidebar:
         st.subheader("💬 Your Chats")
 
+        # Pick up titles finished in the background since the last run
+        if pop_finished(st.session_state.email):
+            st.session_state.chats = get_chat_summaries(st.session_state.email)
+
         # Button to create a new chat
         if st.button("➕ New Chat"):
+            previous_chat = st.session_state.current_chat
             chat_id, title = create_chat_session(st.session_state.email)
             st.session_state.current_chat = chat_id
-            st.session_state.chats = get_all_chats(st.session_state.email)
+            st.session_state.chats = get_chat_summaries(st.session_state.email)
 
             if st.session_state.messages:
+                # Title the chat being left without blocking the page; it shows "New Chat" until then
                 first_message = st.session_state.messages[0]["content"]
-                new_title = generate_chat_title(first_message)
-                update_chat_title(chat_id, new_title)
-                st.session_state.chats = get_all_chats(st.session_state.email)
+                schedule_title(previous_chat, first_message, generate_chat_title, set_generated_title,
+                               owner=st.session_state.email)
 
             st.session_state.messages = []  # Clear current messages
             st.rerun()
@@ -184,21 +206,28 @@ def chat_page():
             chat_id = chat["chat_id"]
             current_title = chat["title"]
 
-            cols = st.columns([0.8, 0.2])
+            cols = st.columns([0.7, 0.15, 0.15])
             with cols[0]:
                 new_title = st.text_input("Rename", value=current_title, key=f"rename_{chat_id}", label_visibility="collapsed")
             if new_title != current_title:
                 update_chat_title(chat_id, new_title)
                 st.rerun()
 
+            # Messages are only loaded for the chat being opened
             with cols[1]:
+                if st.button("📂", key=f"open_{chat_id}", help=f"{chat.get('message_count', 0)} messages"):
+                    st.session_state.current_chat = chat_id
+                    st.session_state.messages = get_chat_messages(chat_id)
+                    st.rerun()
+
+            with cols[2]:
                 if st.button("🗑️", key=f"del_{chat_id}"):
                     delete_chat(chat_id)
-                    st.session_state.chats = get_all_chats(st.session_state.email)
+                    st.session_state.chats = get_chat_summaries(st.session_state.email)
                     if st.session_state.chats:
                         latest = st.session_state.chats[0]
                         st.session_state.current_chat = latest["chat_id"]
-                        st.session_state.messages = latest.get("messages", [])
+                        st.session_state.messages = get_chat_messages(latest["chat_id"])
                     else:
                         st.session_state.current_chat = None
                         st.session_state.messages = []
@@ -251,7 +280,7 @@ def chat_page():
     # Handle new input
     if prompt := st.chat_input("Ask something..."):
         st.session_state.messages.append({"role": "user", "content": prompt})
-        update_chat_messages(st.session_state.current_chat, st.session_state.messages)
+        persist_last_message()
 
         with st.chat_message("user"):
             st.markdown(prompt)
@@ -259,16 +288,15 @@ def chat_page():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("🧠 Thinking...")
-            full_response = ""
+            renderer = StreamRenderer(message_placeholder)
 
             for chunk in stream_ai_response(prompt):
-                full_response += chunk
-                message_placeholder.markdown(full_response + "▌")
+                renderer.write(chunk)
 
-            message_placeholder.markdown(full_response)
+            full_response = renderer.finish()
 
         st.session_state.messages.append({"role": "assistant", "content": full_response})
-        update_chat_messages(st.session_state.current_chat, st.session_state.messages)
+        persist_last_message()
 
 # --- Routing ---
 if not st.session_state.logged_in:
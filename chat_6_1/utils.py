@@ -4,6 +4,12 @@ from passlib.hash import bcrypt
 import os
 from datetime import datetime
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.indexes import ensure_indexes
+from chat_common.cache import MemoryCache
+from chat_common.search import query_terms, terms_pattern, make_snippet
+from chat_common.semantic_index import SEMANTIC_INDEX_DIR, get_semantic_index
 
 load_dotenv()
 
@@ -21,6 +27,15 @@ chat_sessions_collection = db.chat_sessions
 analytics_collection = db.analytics
 admins_collection = db.admins
 tags_collection = db.tags
+response_cache_collection = db.response_cache
+rate_limits_collection = db.rate_limits
+
+# Create missing indexes once per process
+ensure_indexes(db, ["users", "admins", "chat_sessions", "analytics"])
+
+# Message embeddings for search by meaning; filled in the background as messages are saved
+semantic_index = get_semantic_index(os.path.join(SEMANTIC_INDEX_DIR, db.name))
+SEMANTIC_MIN_SCORE = float(os.getenv("SEMANTIC_MIN_SCORE", "0.2"))
 
 # --- User Auth Functions ---
 def get_user(email):
@@ -69,6 +84,8 @@ def create_chat_session(email):
         "chat_id": chat_id,
         "title": default_title,
         "messages": [],
+        "summary": "",
+        "summarized_count": 0,
         "timestamp": datetime.utcnow()
     })
     return chat_id, default_title
@@ -79,11 +96,102 @@ def get_all_chats(email):
 def get_chat_by_id(chat_id):
     return chat_sessions_collection.find_one({"chat_id": chat_id})
 
+# Messages of recently opened chats, kept current by the write functions below
+recent_chat_messages = MemoryCache(max_entries=32, ttl_seconds=300)
+
+def get_chat_summaries(email):
+    """Sidebar listing: chat_id, title, timestamp and message count, without the messages themselves"""
+    return list(chat_sessions_collection.aggregate([
+        {"$match": {"email": email}},
+        {"$sort": {"timestamp": -1}},
+        {"$project": {
+            "_id": 0, "chat_id": 1, "title": 1, "timestamp": 1,
+            "message_count": {"$size": {"$ifNull": ["$messages", []]}}
+        }}
+    ]))
+
+def search_chats(email, query, page=0, page_size=10):
+    """Rank a user's chats by text match on titles and messages; return (results, has_more)"""
+    terms = query_terms(query)
+    if not terms:
+        return [], False
+    pattern = terms_pattern(terms)
+    results = list(chat_sessions_collection.aggregate([
+        {"$match": {"email": email, "$text": {"$search": query}}},
+        {"$sort": {"score": {"$meta": "textScore"}, "timestamp": -1}},
+        {"$skip": page * page_size},
+        {"$limit": page_size + 1},
+        # Ship only the first matching message of each chat, for the snippet
+        {"$project": {
+            "_id": 0, "chat_id": 1, "title": 1, "timestamp": 1,
+            "score": {"$meta": "textScore"},
+            "matches": {"$slice": [{"$filter": {
+                "input": {"$ifNull": ["$messages", []]},
+                "cond": {"$regexMatch": {"input": "$$this.content", "regex": pattern, "options": "i"}}
+            }}, 1]}
+        }}
+    ]))
+    for result in results:
+        matches = result.pop("matches")
+        result["role"] = matches[0]["role"] if matches else None
+        result["snippet"] = make_snippet(matches[0]["content"], terms) if matches else make_snippet(result["title"], terms)
+    return results[:page_size], len(results) > page_size
+
+def semantic_search_chats(email, query, page=0, page_size=10):
+    """Rank a user's chats by the message closest in meaning to the query; same shape as search_chats"""
+    if not query.strip():
+        return [], False
+    titles = {chat["chat_id"]: chat for chat in get_chat_summaries(email)}
+    hits = semantic_index.search(query, list(titles), limit=(page + 1) * page_size + 1)
+    hits = [hit for hit in hits if hit["score"] >= SEMANTIC_MIN_SCORE]
+    terms = query_terms(query)
+    results = [{
+        "chat_id": hit["chat_id"], "title": titles[hit["chat_id"]]["title"],
+        "timestamp": titles[hit["chat_id"]]["timestamp"], "score": hit["score"],
+        "role": hit["role"], "snippet": make_snippet(hit["preview"], terms)
+    } for hit in hits[page * page_size:]]
+    return results[:page_size], len(results) > page_size
+
+def get_chat_messages(chat_id):
+    """Load the messages of the chat being opened"""
+    messages = recent_chat_messages.get(chat_id)
+    if messages is None:
+        chat = chat_sessions_collection.find_one({"chat_id": chat_id}, {"_id": 0, "messages": 1})
+        messages = chat.get("messages", []) if chat else []
+        recent_chat_messages.set(chat_id, messages)
+    # The caller appends to its list; keep the cached one separate
+    return list(messages)
+
 def update_chat_messages(chat_id, messages):
+    """Rewrite the whole history; append_chat_messages is the per-turn path"""
     chat_sessions_collection.update_one(
         {"chat_id": chat_id},
         {"$set": {"messages": messages}}
     )
+    recent_chat_messages.set(chat_id, list(messages))
+    semantic_index.schedule(chat_id, messages, replace=True)
+
+def append_chat_messages(chat_id, new_messages, seq):
+    """Push new messages, numbered from seq, only if the chat still holds exactly seq messages.
+
+    Returns False when another writer got there first, so the caller can
+    reload the stored messages and append again at their length.
+    """
+    query = {"chat_id": chat_id, f"messages.{seq}": {"$exists": False}}
+    if seq:
+        query[f"messages.{seq - 1}"] = {"$exists": True}
+    pushed = [{**m, "seq": seq + i} for i, m in enumerate(new_messages)]
+    result = chat_sessions_collection.update_one(query, {"$push": {"messages": {"$each": pushed}}})
+    if result.modified_count != 1:
+        recent_chat_messages.delete(chat_id)
+        return False
+    cached = recent_chat_messages.get(chat_id)
+    if cached is not None and len(cached) == seq:
+        recent_chat_messages.set(chat_id, cached + pushed)
+    else:
+        recent_chat_messages.delete(chat_id)
+    semantic_index.schedule(chat_id, pushed, seq)
+    return True
 
 def update_chat_title(chat_id, new_title):
     chat_sessions_collection.update_one(
@@ -91,16 +199,52 @@ def update_chat_title(chat_id, new_title):
         {"$set": {"title": new_title}}
     )
 
+def set_generated_title(chat_id, title):
+    """Set an auto-generated title unless the chat has been renamed in the meantime"""
+    chat_sessions_collection.update_one(
+        {"chat_id": chat_id, "title": "New Chat"},
+        {"$set": {"title": title}}
+    )
+
 def delete_chat(chat_id):
     chat_sessions_collection.delete_one({"chat_id": chat_id})
+    recent_chat_messages.delete(chat_id)
+    semantic_index.schedule_remove(chat_id)
+
+# --- Conversation Summary Functions ---
+def get_chat_summary(chat_id):
+    """Return (summary, number of leading messages it covers) for a chat"""
+    chat = chat_sessions_collection.find_one(
+        {"chat_id": chat_id},
+        {"_id": 0, "summary": 1, "summarized_count": 1}
+    ) or {}
+    return chat.get("summary", ""), chat.get("summarized_count", 0)
+
+def update_chat_summary(chat_id, summary, summarized_count):
+    # Only move forward, so a slow refresh never overwrites a newer summary
+    chat_sessions_collection.update_one(
+        {
+            "chat_id": chat_id,
+            "$or": [
+                {"summarized_count": {"$lt": summarized_count}},
+                {"summarized_count": {"$exists": False}}
+            ]
+        },
+        {"$set": {
+            "summary": summary,
+            "summarized_count": summarized_count,
+            "summary_updated_at": datetime.utcnow()
+        }}
+    )
 
 # --- Analytics Functions ---
-def add_token_usage_record(email, prompt_tokens, completion_tokens):
+def add_token_usage_record(email, prompt_tokens, completion_tokens, estimated=False):
     record = {
         "email": email,
         "prompt_tokens": prompt_tokens,
         "completion_tokens": completion_tokens,
         "total_tokens": prompt_tokens + completion_tokens,
+        "estimated": estimated,  # True when counted locally because the provider sent no usage
         "timestamp": datetime.utcnow()
     }
     analytics_collection.insert_one(record)
@@ -1,10 +1,13 @@
 # FILE: chat_5_1/app.py
 import streamlit as st
-import requests
 import json
 import os
 import hashlib
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.async_stream import stream_deltas, StreamError, warm_up
+from chat_common.render import StreamRenderer
 from datetime import datetime, timedelta
 from utils import get_user, create_user, verify_password, save_message, get_messages
 
@@ -22,6 +25,9 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com "
 YOUR_SITE_NAME = "MyAIApp"
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up("https://openrouter.ai/api/v1/chat/completions")
+
 st.set_page_config(
     page_title="🤖 AI Chatbot",
     page_icon="🤖"
@@ -74,25 +80,11 @@ def stream_ai_response(user_message):
     }
 
     def generate():
-        with requests.post(url, headers=headers, json=data, stream=True) as response:
-            try:
-                response.raise_for_status()
-                for line in response.iter_lines():
-                    if line:
-                        decoded_line = line.decode("utf-8").strip()
-                        if decoded_line.startswith("data: "):
-                            json_data = decoded_line[6:]
-                            if json_data == "[DONE]":
-                                break
-                            try:
-                                chunk = json.loads(json_data)
-                                delta = chunk["choices"][0]["delta"].get("content")
-                                if delta:
-                                    yield delta
-                            except json.JSONDecodeError:
-                                continue
-            except requests.exceptions.RequestException as e:
-                yield f"\n\n⚠️ Error: {e}"
+        try:
+            for delta in stream_deltas(data, url=url, headers=headers):
+                yield delta
+        except StreamError as e:
+            yield f"\n\n⚠️ Error: {e}"
 
     return generate()
 
@@ -105,7 +97,7 @@ def login_page():
         if verify_password(email, password):
             st.session_state.logged_in = True
             st.session_state.email = email
-            st.session_state.messages = get_messages(email)
+            st.session_state.messages, st.session_state.older_messages = get_messages(email)
             st.rerun()
         else:
             st.error("Invalid credentials")
@@ -129,6 +121,7 @@ def chat_page():
             st.session_state.logged_in = False
             st.session_state.email = ""
             st.session_state.messages = []
+            st.session_state.older_messages = None
             st.rerun()
         st.markdown("---")
         st.markdown("🧠 Powered by DeepSeek via OpenRouter")
@@ -148,6 +141,12 @@ def chat_page():
 
     st.title("🤖 AI Chatbot")
 
+    # Older history is fetched a page at a time, on request
+    if st.session_state.get("older_messages") is not None and st.button("⬆️ Load older messages"):
+        older, st.session_state.older_messages = get_messages(st.session_state.email, before=st.session_state.older_messages)
+        st.session_state.messages = older + st.session_state.messages
+        st.rerun()
+
     # Display existing messages
     for message in st.session_state.messages:
         with st.chat_message(message["role"]):
@@ -176,13 +175,12 @@ def chat_page():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("🧠 Thinking...")
-            full_response = ""
+            renderer = StreamRenderer(message_placeholder, cursor="|")
 
             for chunk in stream_ai_response(prompt):
-                full_response += chunk
-                message_placeholder.markdown(full_response + "|")
+                renderer.write(chunk)
 
-            message_placeholder.markdown(full_response)
+            full_response = renderer.finish()
 
         # Save AI response
         timestamp_assistant = datetime.utcnow()
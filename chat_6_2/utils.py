@@ -6,6 +6,11 @@ from pymongo import MongoClient
 from passlib.hash import bcrypt
 import os
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.indexes import ensure_indexes
+from chat_common.write_behind import get_write_buffer
+from chat_common.history import keyset_page, HISTORY_PAGE_SIZE
 
 load_dotenv()
 
@@ -15,6 +20,12 @@ db = client.chatbot_db_7pm29jun25
 users_collection = db.users
 messages_collection = db.messages
 
+# Create missing indexes once per process
+ensure_indexes(db, ["users", "messages"])
+
+# Messages are queued and written in batches off the request path
+message_writes = get_write_buffer(messages_collection)
+
 def get_user(email):
     return users_collection.find_one({"email": email})
 
@@ -34,15 +45,18 @@ def verify_password(email, password):
 def save_message(email, message, is_user=True, timestamp=None):
     if timestamp is None:
         timestamp = datetime.utcnow()
-    messages_collection.insert_one({
+    message_writes.insert({
         "email": email,
         "text": message,
         "is_user": is_user,
         "timestamp": timestamp
     })
 
-def get_messages(email):
-    messages = list(messages_collection.find({"email": email}, sort=[("timestamp", 1)]))
+def get_messages(email, before=None, limit=HISTORY_PAGE_SIZE):
+    """Return a page of messages, oldest first, and the cursor for the page before it (None at the start)"""
+    # Include messages still waiting in the write buffer
+    message_writes.flush()
+    messages, older = keyset_page(messages_collection, {"email": email}, before, limit)
     converted = []
     for msg in messages:
         role = "user" if msg["is_user"] else "assistant"
@@ -53,7 +67,7 @@ def get_messages(email):
             "content": msg["text"],
             "time": msg["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
         })
-    return converted
+    return converted, older
 
 def generate_id(email, timestamp):
     """Generate a unique ID based on timestamp and email"""
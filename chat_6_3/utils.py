@@ -6,6 +6,11 @@ from passlib.hash import bcrypt
 import os
 import hashlib
 from dotenv import load_dotenv
+import sys
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from chat_common.indexes import ensure_indexes
+from chat_common.history import HISTORY_PAGE_SIZE
+from chat_common.buckets import ConversationBuckets
 
 load_dotenv()
 
@@ -14,6 +19,13 @@ client = MongoClient(MONGO_URI)
 db = client.chatbot_db_4
 users_collection = db.users
 conversations_collection = db.conversations
+conversation_buckets_collection = db.conversation_buckets
+
+# Create missing indexes once per process
+ensure_indexes(db, ["users", "conversations", "conversation_buckets"])
+
+# Pairs live in fixed-size buckets; a user's old single conversation document is bucketed on first use
+conversation_store = ConversationBuckets(conversation_buckets_collection, legacy=conversations_collection)
 
 def generate_id(email, timestamp):
     """Generate a unique ID based on timestamp and email"""
@@ -48,29 +60,18 @@ def save_message_pair(email, user_prompt, assistant_reply, timestamp):
         "timestamp": timestamp
     }
     
-    # Update the conversation document
-    conversations_collection.update_one(
-        {"email": email},
-        {
-            "$push": {"messages": message_entry},
-            "$setOnInsert": {"created_at": timestamp},
-            "$set": {"updated_at": timestamp}
-        },
-        upsert=True
-    )
+    # Append to the newest bucket, opening a new one when it is full
+    conversation_store.append(email, message_entry, timestamp)
+
+def get_messages(email, before=None, limit=HISTORY_PAGE_SIZE):
+    """Retrieve at least `limit` message pairs from the buckets before `before`, formatted for session state.
+
+    Returns (messages, cursor for the page before it or None at the start).
+    """
+    page, older = conversation_store.page(email, before, limit)
 
-def get_messages(email):
-    """Retrieve and format messages for session state"""
-    conversation = conversations_collection.find_one(
-        {"email": email},
-        {"_id": 0, "messages": 1}
-    )
-    
-    if not conversation or "messages" not in conversation:
-        return []
-    
     formatted_messages = []
-    for msg in conversation["messages"]:
+    for msg in page:
         # Add user message
         formatted_messages.append({
             "id": msg["message_id"],
@@ -87,4 +88,4 @@ def get_messages(email):
             "time": msg["timestamp"].strftime("%Y-%m-%d %H:%M:%S")
         })
     
-    return formatted_messages
\ No newline at end of file
+    return formatted_messages, older
\ No newline at end of file
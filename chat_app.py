@@ -3,6 +3,9 @@ import requests
 import json
 import os
 from dotenv import load_dotenv
+from chat_common.openrouter import get_session, warm_up
+from chat_common.cache import get_cache, cached_completion
+from chat_common.semantic_cache import get_semantic_cache, semantic_completion
 
 load_dotenv()
 
@@ -15,6 +18,14 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com"   # Optional
 YOUR_SITE_NAME = "MyAIApp"                # Optional
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up("https://openrouter.ai/api/v1/chat/completions")
+
+# Opt-in exact-match response cache (RESPONSE_CACHE=memory|disk)
+response_cache = get_cache()
+# Opt-in cache that also serves paraphrases of earlier prompts (SEMANTIC_CACHE=on)
+semantic_cache = get_semantic_cache()
+
 # --- Function to get AI response ---
 def get_ai_response(user_message):
     url = "https://openrouter.ai/api/v1/chat/completions" 
@@ -36,11 +47,15 @@ def get_ai_response(user_message):
         "temperature": 0.7
     }
 
-    try:
-        response = requests.post(url, headers=headers, data=json.dumps(data))
+    def request_completion(data):
+        response = get_session().post(url, headers=headers, data=json.dumps(data))
         response.raise_for_status()
         result = response.json()
         return result['choices'][0]['message']['content']
+
+    try:
+        return semantic_completion(semantic_cache, data,
+                                   lambda data: cached_completion(response_cache, data, request_completion))
     except requests.exceptions.RequestException as e:
         return f"API Error: {e}"
     except KeyError:
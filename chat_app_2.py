@@ -3,6 +3,8 @@ import requests
 import json
 import os
 from dotenv import load_dotenv
+from chat_common.openrouter import get_session, warm_up
+from chat_common.render import StreamRenderer
 
 # Load environment variables
 load_dotenv()
@@ -16,6 +18,9 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com" 
 YOUR_SITE_NAME = "MyAIApp"
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up("https://openrouter.ai/api/v1/chat/completions")
+
 # --- Function to stream AI response ---
 def stream_ai_response(user_message):
     url = "https://openrouter.ai/api/v1/chat/completions" 
@@ -40,7 +45,7 @@ def stream_ai_response(user_message):
 
     # Create a generator to yield chunks of response
     def generate():
-        with requests.post(url, headers=headers, json=data, stream=True) as response:
+        with get_session().post(url, headers=headers, json=data, stream=True) as response:
             try:
                 response.raise_for_status()
                 for line in response.iter_lines():
@@ -86,15 +91,14 @@ if prompt := st.chat_input("Ask something..."):
     with st.chat_message("assistant"):
         message_placeholder = st.empty()
         message_placeholder.markdown("🧠 Thinking...")
-        full_response = ""
+        renderer = StreamRenderer(message_placeholder)
 
-        # Stream response into placeholder
+        # Stream response into placeholder, redrawing a few times a second
         for chunk in stream_ai_response(prompt):
-            full_response += chunk
-            message_placeholder.markdown(full_response + "▌")  # Show cursor while typing
+            renderer.write(chunk)
 
         # Final update without cursor
-        message_placeholder.markdown(full_response)
+        full_response = renderer.finish()
 
     # Add AI response to chat history
     st.session_state.messages.append({"text": full_response, "is_user": False})
\ No newline at end of file
@@ -3,6 +3,10 @@ import requests
 import json
 import os
 from dotenv import load_dotenv
+from chat_common.openrouter import get_session, warm_up
+from chat_common.render import StreamRenderer
+from chat_common.indexes import ensure_indexes
+from chat_common.write_behind import get_write_buffer
 import datetime
 from pymongo import MongoClient
 from passlib.hash import bcrypt
@@ -15,6 +19,9 @@ client = MongoClient(MONGO_URI)
 db = client.chatbot_db
 users_collection = db.users
 messages_collection = db.messages
+ensure_indexes(db, ["users", "messages"])
+# Messages are queued and written in batches off the request path
+message_writes = get_write_buffer(messages_collection)
 
 if api_key is None:
     raise ValueError("OPENROUTER_API_KEY not found in .env😒")
@@ -32,6 +39,9 @@ OPENROUTER_API_KEY = api_key
 YOUR_SITE_URL = "https://your-site.com" 
 YOUR_SITE_NAME = "MyAIApp"
 
+# Open a pooled keep-alive connection to the provider up front
+warm_up("https://openrouter.ai/api/v1/chat/completions")
+
 ## utilities user related 
 def get_user(email):
     return users_collection.find_one({"email": email})
@@ -50,7 +60,7 @@ def verify_password(email, password):
     return bcrypt.verify(password, user["password"])
 
 def save_message(email, message, is_user=True):
-    messages_collection.insert_one({
+    message_writes.insert({
         "email": email,
         "text": message,
         "is_user": is_user,
@@ -58,6 +68,8 @@ def save_message(email, message, is_user=True):
     })
 
 def get_messages(email):
+    # Include messages still waiting in the write buffer
+    message_writes.flush()
     return list(messages_collection.find({"email": email}, sort=[("timestamp", 1)]))
 
 def login_page():
@@ -110,7 +122,7 @@ def stream_ai_response(user_message):
 
     # Create a generator to yield chunks of response
     def generate():
-        with requests.post(url, headers=headers, json=data, stream=True) as response:
+        with get_session().post(url, headers=headers, json=data, stream=True) as response:
             try:
                 response.raise_for_status()
                 for line in response.iter_lines():
@@ -164,15 +176,14 @@ def chat_page():
         with st.chat_message("assistant"):
             message_placeholder = st.empty()
             message_placeholder.markdown("🧠 Thinking...")
-            full_response = ""
+            renderer = StreamRenderer(message_placeholder)
 
-            # Stream response into placeholder
+            # Stream response into placeholder, redrawing a few times a second
             for chunk in stream_ai_response(prompt):
-                full_response += chunk
-                message_placeholder.markdown(full_response + "▌")  # Show cursor while typing
+                renderer.write(chunk)
 
             # Final update without cursor
-            message_placeholder.markdown(full_response)
+            full_response = renderer.finish()
 
         # Add AI response to chat history
         st.session_state.messages.append({"text": full_response, "is_user": False})
@@ -0,0 +1,2 @@
+# chat_common
+# Shared helpers used by the chat_* apps.
@@ -0,0 +1,183 @@
+# async_stream.py
+import os
+import queue
+import asyncio
+import threading
+import httpx
+from chat_common import openrouter, sse, resilience, router
+from chat_common.cache import cache_key
+from chat_common.coalesce import StreamCoalescer
+
+# --- Configuration ---
+MAX_CONNECTIONS = int(os.getenv("OPENROUTER_MAX_CONNECTIONS", "100"))
+# Identical requests that overlap in time share one upstream stream
+COALESCE_STREAMS = os.getenv("COALESCE_STREAMS", "1") == "1"
+
+# Raised for transport and HTTP status errors while streaming
+StreamError = httpx.HTTPError
+
+# One event loop per process runs every stream, so concurrent chats cost
+# a coroutine each instead of a blocked thread each.
+_loop = None
+_loop_lock = threading.Lock()
+_client = None
+_warmed_urls = set()
+stream_flights = StreamCoalescer()
+
+
+def get_loop():
+    """Return the shared event loop, starting its thread on first use"""
+    global _loop
+    if _loop is None:
+        with _loop_lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="chat-stream-loop", daemon=True).start()
+                _loop = loop
+    return _loop
+
+
+def get_client():
+    global _client
+    if _client is None:
+        _client = httpx.AsyncClient(
+            limits=httpx.Limits(
+                max_connections=MAX_CONNECTIONS,
+                max_keepalive_connections=openrouter.POOL_MAXSIZE
+            ),
+            timeout=httpx.Timeout(None, connect=resilience.CONNECT_TIMEOUT, read=resilience.READ_TIMEOUT)
+        )
+    return _client
+
+
+# --- Async API ---
+async def _open_events(data, url, headers):
+    payload = {**data, "stream": True}
+    async with get_client().stream("POST", url, headers=headers or openrouter.build_headers(), json=payload) as response:
+        response.raise_for_status()
+        async for event in sse.aiter_events(response.aiter_bytes()):
+            yield event
+
+
+async def astream_events(data, url=None, headers=None, models=None):
+    """Yield the raw SSE payload of each event of a streamed request.
+
+    Timeouts, retries, hedging and the circuit breaker from resilience apply.
+    With a list of candidate models the router picks the fastest healthy
+    one and fails over to the next while nothing has been streamed yet.
+    """
+    url = (url or openrouter.get_api_url()).strip()
+
+    def open_model_stream(model, max_retries=resilience.MAX_RETRIES):
+        return resilience.resilient_stream(
+            lambda: _open_events({**data, "model": model}, url, headers),
+            name=router.breaker_name(url, model),
+            max_retries=max_retries
+        )
+
+    if models:
+        events = router.route_stream(
+            router.rank(models, url),
+            # Fewer retries per candidate while another is left; the last one gets the full policy
+            lambda model, last: open_model_stream(
+                model, max_retries=resilience.MAX_RETRIES if last else router.RETRIES_PER_MODEL),
+            url=url
+        )
+    else:
+        events = open_model_stream(data.get("model"))
+    async for event in events:
+        yield event
+
+
+async def astream_chunks(data, url=None, headers=None, models=None):
+    """Yield each parsed completion chunk of a streamed request"""
+    async for event in astream_events(data, url=url, headers=headers, models=models):
+        chunk = sse.parse_chunk(event)
+        if chunk is not None:
+            yield chunk
+
+
+def chunk_content(chunk):
+    choices = chunk.get("choices") or []
+    if not choices:
+        return None
+    return (choices[0].get("delta") or {}).get("content")
+
+
+async def astream_deltas(data, url=None, headers=None, models=None):
+    """Yield only the content deltas of a streamed request"""
+    async for event in astream_events(data, url=url, headers=headers, models=models):
+        delta, _ = sse.parse_delta(event)
+        if delta:
+            yield delta
+
+
+# --- Sync adapter ---
+_DONE = object()
+
+
+def iterate(agen):
+    """Drive an async generator on the shared loop and yield its items in this thread"""
+    items = queue.Queue()
+
+    async def pump():
+        try:
+            async for item in agen:
+                items.put((item, None))
+        except Exception as e:
+            items.put((None, e))
+        finally:
+            items.put(_DONE)
+
+    future = asyncio.run_coroutine_threadsafe(pump(), get_loop())
+    try:
+        while True:
+            entry = items.get()
+            if entry is _DONE:
+                break
+            item, error = entry
+            if error is not None:
+                raise error
+            yield item
+    finally:
+        # Stops the upstream request if the caller abandons the stream early
+        future.cancel()
+
+
+def flight_key(data, url=None, models=None):
+    return f"{(url or openrouter.get_api_url()).strip()}|{','.join(models or [])}|{cache_key(data)}"
+
+
+def stream_chunks(data, url=None, headers=None, models=None, coalesce=COALESCE_STREAMS):
+    def open_stream():
+        return astream_chunks(data, url=url, headers=headers, models=models)
+
+    if coalesce:
+        return iterate(stream_flights.stream(flight_key(data, url, models), open_stream))
+    return iterate(open_stream())
+
+
+def stream_deltas(data, url=None, headers=None, models=None, coalesce=COALESCE_STREAMS):
+    def open_stream():
+        return astream_deltas(data, url=url, headers=headers, models=models)
+
+    if coalesce:
+        return iterate(stream_flights.stream("deltas|" + flight_key(data, url, models), open_stream))
+    return iterate(open_stream())
+
+
+def warm_up(url=None):
+    """Pre-open pooled connections for both the async engine and the shared requests session"""
+    url = (url or openrouter.get_api_url()).strip()
+    openrouter.warm_up(url)
+    if url in _warmed_urls:
+        return
+    _warmed_urls.add(url)
+
+    async def _warm():
+        try:
+            await get_client().head(url, timeout=5)
+        except httpx.HTTPError as e:
+            print(f"Async warm-up failed: {e}")
+
+    asyncio.run_coroutine_threadsafe(_warm(), get_loop())
@@ -0,0 +1,160 @@
+# batch_titles.py
+# Offline job that titles chat_sessions still called "New Chat".
+#
+#   python -m chat_common.batch_titles --db chatbot_db --concurrency 8
+#
+# Sessions are read in _id order and the last finished batch is saved in
+# the batch_jobs collection, so an interrupted run picks up where it
+# stopped (--restart starts over).
+import os
+import time
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+from dotenv import load_dotenv
+from pymongo import MongoClient, UpdateOne
+from chat_common import openrouter
+from chat_common.cache import cache_key
+from chat_common.titles import extract_title, TITLE_MIN_SCORE
+
+load_dotenv()
+
+DEFAULT_TITLE = "New Chat"
+TITLE_PROMPT = "Generate a concise and descriptive title for this conversation:"
+
+
+def first_user_message(session):
+    for message in session.get("messages") or []:
+        if message.get("role") == "user" and message.get("content"):
+            return message["content"]
+    return None
+
+
+def model_title(first_message, url=None, headers=None):
+    data = {
+        "model": openrouter.DEFAULT_MODEL,
+        "messages": [
+            {"role": "system", "content": TITLE_PROMPT},
+            {"role": "user", "content": first_message}
+        ],
+        "temperature": 0.3,
+        "max_tokens": 30
+    }
+    return openrouter.completion_calls.call(
+        cache_key(data), lambda: openrouter.complete(data, url=url, headers=headers)
+    )
+
+
+def title_session(session, local_only=False):
+    """Return (session _id, title or None, source)"""
+    first_message = first_user_message(session)
+    if not first_message:
+        return session["_id"], None, "empty"
+    title, score = extract_title(first_message)
+    if score >= TITLE_MIN_SCORE or local_only:
+        return session["_id"], title or None, "local"
+    try:
+        return session["_id"], model_title(first_message) or title or None, "model"
+    except Exception as e:
+        print(f"Model title for {session['_id']} failed, keeping the local one: {e}")
+        return session["_id"], title or None, "local"
+
+
+class BatchTitler:
+    def __init__(self, sessions, checkpoints, concurrency=8, batch_size=100, local_only=False):
+        self.sessions = sessions
+        self.checkpoints = checkpoints
+        self.checkpoint_id = f"titles:{sessions.full_name}"
+        self.concurrency = concurrency
+        self.batch_size = batch_size
+        self.local_only = local_only
+        self.counts = {"seen": 0, "titled": 0, "local": 0, "model": 0, "skipped": 0}
+
+    def resume_from(self):
+        checkpoint = self.checkpoints.find_one({"_id": self.checkpoint_id})
+        return checkpoint["last_id"] if checkpoint else None
+
+    def save_checkpoint(self, last_id):
+        self.checkpoints.update_one(
+            {"_id": self.checkpoint_id},
+            {"$set": {"last_id": last_id, "counts": self.counts, "updated_at": time.time()}},
+            upsert=True
+        )
+
+    def reset(self):
+        self.checkpoints.delete_one({"_id": self.checkpoint_id})
+
+    def untitled(self, after=None, limit=0):
+        query = {"title": DEFAULT_TITLE, "messages.0": {"$exists": True}}
+        if after is not None:
+            query["_id"] = {"$gt": after}
+        # Only the opening messages are needed to title a chat
+        projection = {"_id": 1, "messages": {"$slice": 2}}
+        return self.sessions.find(query, projection).sort("_id", 1).batch_size(self.batch_size).limit(limit)
+
+    def run_batch(self, pool, batch):
+        results = list(pool.map(lambda s: title_session(s, self.local_only), batch))
+        writes = []
+        for session_id, title, source in results:
+            if not title:
+                self.counts["skipped"] += 1
+                continue
+            self.counts[source] += 1
+            # Leave chats alone that were renamed while the job ran
+            writes.append(UpdateOne({"_id": session_id, "title": DEFAULT_TITLE}, {"$set": {"title": title}}))
+        if writes:
+            self.counts["titled"] += self.sessions.bulk_write(writes, ordered=False).modified_count
+        self.counts["seen"] += len(batch)
+        self.save_checkpoint(batch[-1]["_id"])
+
+    def run(self, limit=0):
+        started = time.perf_counter()
+        after = self.resume_from()
+        if after is not None:
+            print(f"Resuming after {after}")
+        batch = []
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            for session in self.untitled(after, limit):
+                batch.append(session)
+                if len(batch) >= self.batch_size:
+                    self.run_batch(pool, batch)
+                    batch = []
+                    self.report(started)
+            if batch:
+                self.run_batch(pool, batch)
+                self.report(started)
+        if not self.counts["seen"]:
+            print("No untitled sessions left")
+        return self.counts
+
+    def report(self, started):
+        elapsed = time.perf_counter() - started
+        rate = self.counts["seen"] / elapsed if elapsed else 0.0
+        print(f"{self.counts['seen']} sessions in {elapsed:.1f}s ({rate:.1f}/s): "
+              f"{self.counts['titled']} titled ({self.counts['local']} local, {self.counts['model']} model), "
+              f"{self.counts['skipped']} skipped")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Title chat sessions still called 'New Chat'")
+    parser.add_argument("--db", default="chatbot_db", help="database holding chat_sessions (chat_5_2 uses chatbot_db_2)")
+    parser.add_argument("--collection", default="chat_sessions")
+    parser.add_argument("--concurrency", type=int, default=8, help="sessions titled in parallel")
+    parser.add_argument("--batch-size", type=int, default=100, help="sessions per bulk write and checkpoint")
+    parser.add_argument("--limit", type=int, default=0, help="stop after this many sessions (0 = all)")
+    parser.add_argument("--local-only", action="store_true", help="never call the model, even for weak titles")
+    parser.add_argument("--restart", action="store_true", help="ignore the saved checkpoint")
+    args = parser.parse_args()
+
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI not found in .env")
+    db = MongoClient(mongo_uri)[args.db]
+    titler = BatchTitler(db[args.collection], db.batch_jobs, concurrency=args.concurrency,
+                         batch_size=args.batch_size, local_only=args.local_only)
+    if args.restart:
+        titler.reset()
+    titler.run(limit=args.limit)
+
+
+if __name__ == "__main__":
+    main()
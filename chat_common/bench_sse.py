@@ -0,0 +1,121 @@
+# bench_sse.py
+# Micro-benchmark: SSEParser vs the line-by-line generate() loop in chat_6_1/app.py
+#
+#   python -m chat_common.bench_sse --events 2000 --read-size 512
+#
+# JSON decoding dominates both loops, so expect rough parity rather than a
+# large speed-up; the parser's gain is correct framing of split reads.
+import json
+import time
+import argparse
+from chat_common.sse import iter_events, parse_delta
+
+
+def build_stream(events, words_per_delta=3):
+    """Synthetic completion stream in the framing OpenRouter uses"""
+    parts = [b": OPENROUTER PROCESSING\n\n"]
+    for i in range(events):
+        chunk = {
+            "id": "gen-bench",
+            "object": "chat.completion.chunk",
+            "model": "deepseek/deepseek-r1-0528:free",
+            "choices": [{"index": 0, "delta": {"role": "assistant", "content": " token" * words_per_delta}}]
+        }
+        parts.append(b"data: " + json.dumps(chunk).encode("utf-8") + b"\n\n")
+    usage = {"choices": [{"index": 0, "delta": {}}], "usage": {"prompt_tokens": 42, "completion_tokens": events * words_per_delta}}
+    parts.append(b"data: " + json.dumps(usage).encode("utf-8") + b"\n\n")
+    parts.append(b"data: [DONE]\n\n")
+    return b"".join(parts)
+
+
+def split_reads(body, read_size):
+    return [body[i:i + read_size] for i in range(0, len(body), read_size)]
+
+
+def iter_lines(reads):
+    """Same splitting as requests.Response.iter_lines"""
+    pending = None
+    for chunk in reads:
+        if pending is not None:
+            chunk = pending + chunk
+        lines = chunk.splitlines()
+        if lines and lines[-1] and chunk and lines[-1][-1] == chunk[-1]:
+            pending = lines.pop()
+        else:
+            pending = None
+        yield from lines
+    if pending is not None:
+        yield pending
+
+
+def baseline(reads):
+    """The generate() loop from chat_6_1/app.py, minus the HTTP call"""
+    text = []
+    total_prompt_tokens = 0
+    total_completion_tokens = 0
+    for line in iter_lines(reads):
+        if line:
+            decoded_line = line.decode("utf-8").strip()
+            if decoded_line.startswith("data: "):
+                json_data = decoded_line[6:]
+                if json_data == "[DONE]":
+                    break
+                try:
+                    chunk = json.loads(json_data)
+                    delta = chunk["choices"][0]["delta"].get("content")
+                    tokens = chunk.get("usage", {})
+                    total_prompt_tokens += tokens.get("prompt_tokens", 0)
+                    total_completion_tokens += tokens.get("completion_tokens", 0)
+                    if delta:
+                        text.append(delta)
+                except json.JSONDecodeError:
+                    continue
+    return "".join(text), total_prompt_tokens, total_completion_tokens
+
+
+def incremental(reads):
+    text = []
+    total_prompt_tokens = 0
+    total_completion_tokens = 0
+    for payload in iter_events(reads):
+        delta, usage = parse_delta(payload)
+        if usage:
+            total_prompt_tokens += usage.get("prompt_tokens", 0)
+            total_completion_tokens += usage.get("completion_tokens", 0)
+        if delta:
+            text.append(delta)
+    return "".join(text), total_prompt_tokens, total_completion_tokens
+
+
+def best_of(fns, reads, repeat):
+    """Best time of each function, run in turn so machine noise hits them alike"""
+    timings = [[] for _ in fns]
+    for _ in range(repeat):
+        for fn, samples in zip(fns, timings):
+            start = time.perf_counter()
+            fn(reads)
+            samples.append(time.perf_counter() - start)
+    return [min(samples) for samples in timings]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark SSEParser against the generate() loop")
+    parser.add_argument("--events", type=int, default=2000)
+    parser.add_argument("--read-size", type=int, default=512)
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    body = build_stream(args.events)
+    reads = split_reads(body, args.read_size)
+    if baseline(reads) != incremental(reads):
+        raise SystemExit("Parsers disagree on the benchmark stream")
+
+    old, new = best_of([baseline, incremental], reads, args.repeat)
+    print(f"{args.events} events, {len(body)} bytes in {len(reads)} reads of {args.read_size} bytes")
+    print(f"generate() loop : {old * 1000:8.2f} ms  ({args.events / old:,.0f} events/s)")
+    print(f"SSEParser       : {new * 1000:8.2f} ms  ({args.events / new:,.0f} events/s)")
+    print(f"speed-up        : {old / new:8.2f}x")
+
+
+if __name__ == "__main__":
+    main()
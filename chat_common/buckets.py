@@ -0,0 +1,160 @@
+# buckets.py
+# Bucketed conversation storage: each email's message pairs are spread over
+# documents of at most CONVERSATION_BUCKET_SIZE pairs, numbered by seq.
+#
+#   python -m chat_common.buckets --db chatbot_db_4   # migrate every per-email conversation
+import os
+import time
+import argparse
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# --- Configuration ---
+CONVERSATION_BUCKET_SIZE = int(os.getenv("CONVERSATION_BUCKET_SIZE", "50"))
+
+DUPLICATE_KEY = 11000
+
+
+def _is_duplicate(error):
+    if getattr(error, "code", None) == DUPLICATE_KEY:
+        return True
+    details = getattr(error, "details", None) or {}
+    return any(err.get("code") == DUPLICATE_KEY for err in details.get("writeErrors", []))
+
+
+class ConversationBuckets:
+    """Append-only pairs in fixed-size bucket documents keyed by (email, seq).
+
+    Appending touches only the newest bucket and reading the recent history
+    touches only the last one or two, however long the conversation gets.
+    With a legacy collection (one document per email holding every pair),
+    a user's old document is copied into buckets the first time they are
+    seen; the original is left in place.
+    """
+
+    def __init__(self, collection, legacy=None, bucket_size=CONVERSATION_BUCKET_SIZE):
+        self.collection = collection
+        self.legacy = legacy
+        self.bucket_size = bucket_size
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def _latest_seq(self, email, refresh=False):
+        """seq of the newest bucket, or -1 when the user has none"""
+        with self._lock:
+            if not refresh and email in self._latest:
+                return self._latest[email]
+        bucket = self.collection.find_one({"email": email}, {"seq": 1}, sort=[("seq", -1)])
+        if bucket is None and self.legacy is not None:
+            self.migrate(self.legacy.find_one({"email": email}))
+            bucket = self.collection.find_one({"email": email}, {"seq": 1}, sort=[("seq", -1)])
+        seq = bucket["seq"] if bucket else -1
+        with self._lock:
+            self._latest[email] = seq
+        return seq
+
+    def append(self, email, entry, timestamp):
+        seq = self._latest_seq(email)
+        while True:
+            if seq >= 0:
+                result = self.collection.update_one(
+                    {"email": email, "seq": seq, "count": {"$lt": self.bucket_size}},
+                    {"$push": {"messages": entry}, "$inc": {"count": 1}, "$set": {"updated_at": timestamp}}
+                )
+                if result.modified_count:
+                    return
+            # The newest bucket is full (or there is none yet): open the next one
+            try:
+                self.collection.insert_one({
+                    "email": email, "seq": seq + 1, "count": 1, "messages": [entry],
+                    "created_at": timestamp, "updated_at": timestamp
+                })
+                with self._lock:
+                    self._latest[email] = seq + 1
+                return
+            except Exception as e:
+                if not _is_duplicate(e):
+                    raise
+                # Another writer opened it first; look again
+                seq = self._latest_seq(email, refresh=True)
+
+    def page(self, email, before=None, limit=CONVERSATION_BUCKET_SIZE):
+        """At least limit pairs (or all that are left) from the buckets before seq `before`, oldest first.
+
+        Returns (pairs, cursor for the page before it or None at the start).
+        """
+        if before is None and self._latest_seq(email) < 0:
+            return [], None
+        query = {"email": email}
+        if before is not None:
+            query["seq"] = {"$lt": before}
+        pairs = []
+        oldest = None
+        for bucket in self.collection.find(query, {"_id": 0, "seq": 1, "messages": 1}, sort=[("seq", -1)]):
+            pairs[:0] = bucket.get("messages", [])
+            oldest = bucket["seq"]
+            if len(pairs) >= limit:
+                break
+        older = oldest if oldest else None
+        return pairs, older
+
+    def migrate(self, conversation):
+        """Copy one legacy per-email document into buckets; returns the number of buckets written"""
+        if not conversation or not conversation.get("messages"):
+            return 0
+        email = conversation["email"]
+        if self.collection.find_one({"email": email}, {"_id": 1}):
+            return 0
+        messages = conversation["messages"]
+        buckets = []
+        for seq, start in enumerate(range(0, len(messages), self.bucket_size)):
+            chunk = messages[start:start + self.bucket_size]
+            buckets.append({
+                "email": email, "seq": seq, "count": len(chunk), "messages": chunk,
+                "created_at": chunk[0].get("timestamp"), "updated_at": chunk[-1].get("timestamp")
+            })
+        try:
+            self.collection.insert_many(buckets, ordered=True)
+        except Exception as e:
+            # A concurrent migration of the same user got there first
+            if not _is_duplicate(e):
+                raise
+            return 0
+        return len(buckets)
+
+
+def migrate_all(store, conversations):
+    """Bucket every legacy conversation; users that already have buckets are skipped, so reruns are safe"""
+    started = time.perf_counter()
+    users = buckets = 0
+    for conversation in conversations.find({}, {"_id": 0, "email": 1, "messages": 1}).batch_size(20):
+        written = store.migrate(conversation)
+        users += 1
+        buckets += written
+        if users % 100 == 0:
+            print(f"{users} conversations checked, {buckets} buckets written ({time.perf_counter() - started:.1f}s)")
+    print(f"Done: {users} conversations checked, {buckets} buckets written in {time.perf_counter() - started:.1f}s")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Move per-email conversations into bucket documents")
+    parser.add_argument("--db", default="chatbot_db_4")
+    parser.add_argument("--source", default="conversations")
+    parser.add_argument("--target", default="conversation_buckets")
+    parser.add_argument("--bucket-size", type=int, default=CONVERSATION_BUCKET_SIZE, help="message pairs per bucket")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    from chat_common.indexes import ensure_indexes
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI not found in .env")
+    db = MongoClient(mongo_uri)[args.db]
+    ensure_indexes(db, [args.target])
+    migrate_all(ConversationBuckets(db[args.target], bucket_size=args.bucket_size), db[args.source])
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+# cache.py
+import os
+import json
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# --- Configuration ---
+# RESPONSE_CACHE selects the backend: memory, disk or mongo. Unset disables caching.
+RESPONSE_CACHE = os.getenv("RESPONSE_CACHE", "").strip().lower()
+CACHE_MAX_ENTRIES = int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1024"))
+CACHE_TTL_SECONDS = int(os.getenv("RESPONSE_CACHE_TTL_SECONDS", str(24 * 3600)))
+CACHE_DIR = os.getenv("RESPONSE_CACHE_DIR", ".response_cache")
+REPLAY_CHUNK_CHARS = 16
+
+# Request fields that change the answer; transport flags such as stream do not
+KEY_PARAMS = ("temperature", "top_p", "top_k", "max_tokens", "stop", "seed",
+              "frequency_penalty", "presence_penalty", "repetition_penalty")
+
+
+def cache_key(data):
+    """Canonical hash of model, messages and sampling parameters of a completion request"""
+    canonical = {
+        "model": data.get("model"),
+        "messages": [{"role": m["role"], "content": m["content"]} for m in data.get("messages", [])],
+        "params": {k: data[k] for k in KEY_PARAMS if data.get(k) is not None}
+    }
+    encoded = json.dumps(canonical, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+# --- Backends ---
+class MemoryCache:
+    """In-process LRU"""
+
+    def __init__(self, max_entries=CACHE_MAX_ENTRIES, ttl_seconds=CACHE_TTL_SECONDS):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._entries[key] = (value, time.time() + self.ttl_seconds)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._entries.pop(key, None)
+
+
+class DiskCache:
+    """One JSON file per key, shared by every process on the host"""
+
+    def __init__(self, directory=CACHE_DIR, ttl_seconds=CACHE_TTL_SECONDS):
+        self.directory = directory
+        self.ttl_seconds = ttl_seconds
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, f"{key}.json")
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl_seconds < time.time():
+                os.remove(path)
+                return None
+            with open(path, encoding="utf-8") as f:
+                return json.load(f)["response"]
+        except (OSError, ValueError, KeyError):
+            return None
+
+    def set(self, key, value):
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"response": value}, f, ensure_ascii=False)
+        os.replace(tmp_path, path)
+
+
+class MongoCache:
+    """Collection-backed cache; Mongo's TTL monitor expires old entries"""
+
+    def __init__(self, collection, ttl_seconds=CACHE_TTL_SECONDS):
+        self.collection = collection
+        self.ttl_seconds = ttl_seconds
+        collection.create_index("created_at", expireAfterSeconds=ttl_seconds)
+
+    def get(self, key):
+        # The TTL monitor only runs once a minute, so check expiry here too
+        doc = self.collection.find_one({
+            "_id": key,
+            "created_at": {"$gt": datetime.utcnow() - timedelta(seconds=self.ttl_seconds)}
+        })
+        return doc["response"] if doc else None
+
+    def set(self, key, value):
+        self.collection.update_one(
+            {"_id": key},
+            {"$set": {"response": value, "created_at": datetime.utcnow()}},
+            upsert=True
+        )
+
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def get_cache(backend=RESPONSE_CACHE, collection=None, directory=CACHE_DIR):
+    """Return the process-wide cache for a backend, or None when caching is off"""
+    if not backend or backend == "off":
+        return None
+    if backend == "mongo" and collection is None:
+        # Apps without a database (chat_app.py) share .env with the ones that have one
+        print("RESPONSE_CACHE=mongo but this app has no Mongo collection; caching in memory instead")
+        backend = "memory"
+    with _caches_lock:
+        if backend not in _caches:
+            if backend == "memory":
+                _caches[backend] = MemoryCache()
+            elif backend == "disk":
+                _caches[backend] = DiskCache(directory)
+            elif backend == "mongo":
+                _caches[backend] = MongoCache(collection)
+            else:
+                raise ValueError(f"Unknown RESPONSE_CACHE backend: {backend}")
+        return _caches[backend]
+
+
+# --- Cached calls ---
+def cached_completion(cache, data, call):
+    """Return call(data), serving and storing the text through cache when one is given"""
+    if cache is None:
+        return call(data)
+    key = cache_key(data)
+    cached = cache.get(key)
+    if cached is not None:
+        return cached
+    response = call(data)
+    cache.set(key, response)
+    return response
+
+
+def replay(text, chunk_chars=REPLAY_CHUNK_CHARS):
+    for i in range(0, len(text), chunk_chars):
+        yield text[i:i + chunk_chars]
+
+
+def cached_stream(cache, data, stream):
+    """Yield deltas from stream(), or replay a cached answer as deltas on a hit.
+
+    The answer is only stored once the upstream stream finishes cleanly.
+    """
+    if cache is None:
+        yield from stream()
+        return
+    key = cache_key(data)
+    cached = cache.get(key)
+    if cached is not None:
+        yield from replay(cached)
+        return
+    parts = []
+    for delta in stream():
+        parts.append(delta)
+        yield delta
+    if parts:
+        cache.set(key, "".join(parts))
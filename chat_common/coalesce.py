@@ -0,0 +1,103 @@
+# coalesce.py
+import asyncio
+import threading
+
+
+class _Flight:
+    def __init__(self):
+        self.items = []
+        self.done = False
+        self.error = None
+        self.subscribers = 0
+        self.task = None
+        self.changed = asyncio.Condition()
+
+
+class StreamCoalescer:
+    """Single-flight for async streams.
+
+    The first caller for a key starts the upstream stream; callers that
+    arrive while it is running subscribe to it instead of opening their own.
+    Every subscriber sees every item from the start, and the upstream is
+    cancelled once the last subscriber goes away.
+    """
+
+    def __init__(self):
+        self._flights = {}
+        self.started = 0
+        self.joined = 0
+
+    async def stream(self, key, factory):
+        flight = self._flights.get(key)
+        if flight is None:
+            flight = _Flight()
+            self._flights[key] = flight
+            flight.task = asyncio.ensure_future(self._run(key, flight, factory))
+            self.started += 1
+        else:
+            self.joined += 1
+        flight.subscribers += 1
+        index = 0
+        try:
+            while True:
+                async with flight.changed:
+                    await flight.changed.wait_for(lambda: index < len(flight.items) or flight.done)
+                while index < len(flight.items):
+                    yield flight.items[index]
+                    index += 1
+                if flight.done and index == len(flight.items):
+                    if flight.error is not None:
+                        raise flight.error
+                    return
+        finally:
+            flight.subscribers -= 1
+            if flight.subscribers == 0 and not flight.done:
+                flight.task.cancel()
+                if self._flights.get(key) is flight:
+                    del self._flights[key]
+
+    async def _run(self, key, flight, factory):
+        try:
+            async for item in factory():
+                async with flight.changed:
+                    flight.items.append(item)
+                    flight.changed.notify_all()
+        except Exception as e:
+            flight.error = e
+        finally:
+            if self._flights.get(key) is flight:
+                del self._flights[key]
+            async with flight.changed:
+                flight.done = True
+                flight.changed.notify_all()
+
+
+class CallCoalescer:
+    """Single-flight for blocking calls: concurrent callers with the same key share one result"""
+
+    def __init__(self):
+        self._calls = {}
+        self._lock = threading.Lock()
+
+    def call(self, key, fn):
+        with self._lock:
+            entry = self._calls.get(key)
+            leader = entry is None
+            if leader:
+                entry = {"event": threading.Event(), "result": None, "error": None}
+                self._calls[key] = entry
+        if not leader:
+            entry["event"].wait()
+            if entry["error"] is not None:
+                raise entry["error"]
+            return entry["result"]
+        try:
+            entry["result"] = fn()
+            return entry["result"]
+        except Exception as e:
+            entry["error"] = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            entry["event"].set()
@@ -0,0 +1,61 @@
+# context.py
+import os
+from chat_common.tokens import count_tokens, count_message_tokens, count_messages_tokens, MESSAGE_OVERHEAD_TOKENS
+
+# --- Configuration ---
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "6000"))
+# The newest messages are always sent, even if they alone exceed the budget
+MIN_RECENT_MESSAGES = 2
+# Below this many spare tokens an older message is dropped instead of elided
+MIN_ELIDED_TOKENS = 64
+ELISION_MARK = "[… earlier part of this message omitted …]"
+
+
+def _elide(message, tokens):
+    """Keep roughly the last `tokens` tokens of a message"""
+    content = message["content"]
+    chars_per_token = len(content) / max(1, count_tokens(content))
+    keep_chars = int((tokens - count_tokens(ELISION_MARK)) * chars_per_token)
+    return {"role": message["role"], "content": ELISION_MARK + "\n\n" + content[max(0, len(content) - keep_chars):]}
+
+
+def build_context(system_prompt, messages, budget=CONTEXT_TOKEN_BUDGET, pinned=()):
+    """Fit a chat history into a token budget.
+
+    Returns (request_messages, stats). The system prompt, the pinned messages
+    (such as a conversation summary) and the most recent messages are kept;
+    the newest message that does not fit whole is elided, and everything older
+    is dropped. stats reports the tokens sent, the tokens the full history
+    would have cost and the difference.
+    """
+    history = [{"role": m["role"], "content": m["content"]} for m in messages]
+    system = [{"role": "system", "content": system_prompt}] if system_prompt else []
+    system += [{"role": m["role"], "content": m["content"]} for m in pinned]
+
+    used = count_messages_tokens(system)
+    kept = []
+    elided = 0
+    for message in reversed(history):
+        cost = count_message_tokens(message)
+        if used + cost <= budget or len(kept) < MIN_RECENT_MESSAGES:
+            kept.append(message)
+            used += cost
+            continue
+        spare = budget - used - MESSAGE_OVERHEAD_TOKENS
+        if spare >= MIN_ELIDED_TOKENS:
+            message = _elide(message, spare)
+            kept.append(message)
+            used += count_message_tokens(message)
+            elided = 1
+        break
+    kept.reverse()
+
+    full = used if len(kept) == len(history) else count_messages_tokens(system + history)
+    stats = {
+        "prompt_tokens": used,
+        "full_prompt_tokens": full,
+        "saved_tokens": full - used,
+        "dropped_messages": len(history) - len(kept),
+        "elided_messages": elided
+    }
+    return system + kept, stats
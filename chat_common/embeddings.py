@@ -0,0 +1,68 @@
+# embeddings.py
+import os
+import re
+import zlib
+import threading
+import numpy as np
+
+# --- Configuration ---
+# Small CPU sentence-transformers model. Without it (or without the package),
+# a hashed bag of words is used: weaker on paraphrases, but needs nothing.
+EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "sentence-transformers/all-MiniLM-L6-v2").strip()
+EMBEDDING_BATCH_SIZE = 32
+HASHED_DIM = 384
+MAX_EMBED_CHARS = 2000
+
+_WORD_RE = re.compile(r"\w+")
+
+_model = None
+_model_loaded = False
+_model_lock = threading.Lock()
+
+
+def get_model():
+    global _model, _model_loaded
+    with _model_lock:
+        if not _model_loaded:
+            _model_loaded = True
+            if EMBEDDING_MODEL:
+                try:
+                    from sentence_transformers import SentenceTransformer
+                    _model = SentenceTransformer(EMBEDDING_MODEL, device="cpu")
+                except Exception as e:
+                    print(f"Embedding model {EMBEDDING_MODEL} unavailable, using hashed embeddings instead: {e}")
+    return _model
+
+
+def model_name():
+    """Identifies the vector space, so indexes built with another model are not mixed in"""
+    return EMBEDDING_MODEL if get_model() is not None else f"hashed-{HASHED_DIM}"
+
+
+def dimension():
+    model = get_model()
+    return model.get_sentence_embedding_dimension() if model is not None else HASHED_DIM
+
+
+def _hashed(text):
+    vector = np.zeros(HASHED_DIM, dtype=np.float32)
+    words = _WORD_RE.findall(text.lower())
+    for feature in words + [f"{a} {b}" for a, b in zip(words, words[1:])]:
+        h = zlib.crc32(feature.encode("utf-8"))
+        vector[h % HASHED_DIM] += 1.0 if h & 0x80000000 else -1.0
+    return vector
+
+
+def embed(texts):
+    """Unit-length float32 vectors, one row per text"""
+    texts = [t[:MAX_EMBED_CHARS] for t in texts]
+    if not texts:
+        return np.zeros((0, dimension()), dtype=np.float32)
+    model = get_model()
+    if model is not None:
+        vectors = model.encode(texts, batch_size=EMBEDDING_BATCH_SIZE, convert_to_numpy=True,
+                               normalize_embeddings=True, show_progress_bar=False)
+        return vectors.astype(np.float32, copy=False)
+    vectors = np.stack([_hashed(t) for t in texts])
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    return vectors / np.maximum(norms, 1e-12)
@@ -0,0 +1,32 @@
+# history.py
+import os
+
+# --- Configuration ---
+# Messages loaded at login and per "load older" click
+HISTORY_PAGE_SIZE = int(os.getenv("HISTORY_PAGE_SIZE", "50"))
+
+
+def keyset_page(collection, query, before=None, limit=HISTORY_PAGE_SIZE):
+    """Newest page of documents matching query that come before the cursor, oldest first.
+
+    Pages are keyed on (timestamp, _id) rather than skipped by offset, so
+    each page is one backward range read on the (email, timestamp, _id)
+    index however far back it is. Returns (documents, cursor of the next
+    older page or None).
+    """
+    query = dict(query)
+    if before is not None:
+        timestamp, doc_id = before
+        # The top-level bound gives the index scan its range; the $or only trims ties at the boundary
+        query["timestamp"] = {"$lte": timestamp}
+        query["$or"] = [
+            {"timestamp": {"$lt": timestamp}},
+            {"_id": {"$lt": doc_id}}
+        ]
+    page = list(collection.find(query, sort=[("timestamp", -1), ("_id", -1)], limit=limit + 1))
+    older = None
+    if len(page) > limit:
+        page = page[:limit]
+        older = (page[-1]["timestamp"], page[-1]["_id"])
+    page.reverse()
+    return page, older
@@ -0,0 +1,111 @@
+# indexes.py
+# Index declarations shared by every app's utils module.
+#
+#   python -m chat_common.indexes --db chatbot_db          # create what is missing
+#   python -m chat_common.indexes --db chatbot_db --stats  # and show how often each index is used
+import os
+import argparse
+import threading
+from dotenv import load_dotenv
+
+load_dotenv()
+
+# Collection -> indexes, matched to the lookups in the utils modules
+INDEXES = {
+    "users": [
+        {"keys": [("email", 1)], "name": "email_unique", "unique": True},
+    ],
+    "admins": [
+        {"keys": [("email", 1)], "name": "email_unique", "unique": True},
+    ],
+    "chat_sessions": [
+        {"keys": [("chat_id", 1)], "name": "chat_id_unique", "unique": True},
+        # Sidebar list: one user's chats, newest first
+        {"keys": [("email", 1), ("timestamp", -1)], "name": "email_timestamp"},
+        # Chat search; the email prefix keeps each query inside one user's chats
+        {"keys": [("email", 1), ("title", "text"), ("messages.content", "text")], "name": "email_text",
+         "weights": {"title": 5, "messages.content": 1}, "default_language": "english"},
+    ],
+    "analytics": [
+        {"keys": [("email", 1), ("timestamp", 1)], "name": "email_timestamp"},
+    ],
+    # History pages walk this backwards; _id breaks timestamp ties, so the sort needs no SORT stage
+    "messages": [
+        {"keys": [("email", 1), ("timestamp", 1), ("_id", 1)], "name": "email_timestamp_id"},
+    ],
+    "conversations": [
+        {"keys": [("email", 1)], "name": "email_unique", "unique": True},
+    ],
+    # Newest bucket first for appends and recent history
+    "conversation_buckets": [
+        {"keys": [("email", 1), ("seq", -1)], "name": "email_seq_unique", "unique": True},
+    ],
+}
+
+_ensured = set()
+_ensured_lock = threading.Lock()
+
+
+def ensure_indexes(db, collections=None):
+    """Create the declared indexes of the given collections (all by default) if they are missing.
+
+    Safe to call on every start: create_index is a no-op for an index that
+    already exists, and each database is only checked once per process.
+    A failure such as duplicate emails blocking a unique index is printed
+    and skipped, so the app still starts.
+    """
+    collections = sorted(collections or INDEXES)
+    key = (id(db.client), db.name, tuple(collections))
+    with _ensured_lock:
+        if key in _ensured:
+            return
+        _ensured.add(key)
+
+    for name in collections:
+        for spec in INDEXES.get(name, []):
+            options = {k: v for k, v in spec.items() if k != "keys"}
+            try:
+                db[name].create_index(spec["keys"], **options)
+            except Exception as e:
+                print(f"Could not create index {spec['name']} on {db.name}.{name}: {e}")
+
+
+def index_usage(db, collections=None):
+    """Return one row per index with the operations counted by $indexStats since the server started"""
+    rows = []
+    for name in sorted(collections or INDEXES):
+        for stat in db[name].aggregate([{"$indexStats": {}}]):
+            rows.append({
+                "collection": name,
+                "index": stat["name"],
+                "ops": stat["accesses"]["ops"],
+                "since": stat["accesses"]["since"]
+            })
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Create the shared indexes and report their usage")
+    parser.add_argument("--db", default="chatbot_db")
+    parser.add_argument("--collections", default=None, help="comma separated (default: every declared collection)")
+    parser.add_argument("--stats", action="store_true", help="print $indexStats for each index")
+    args = parser.parse_args()
+
+    from pymongo import MongoClient
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI not found in .env")
+    db = MongoClient(mongo_uri)[args.db]
+    collections = [c.strip() for c in args.collections.split(",")] if args.collections else None
+
+    ensure_indexes(db, collections)
+    for name in sorted(collections or INDEXES):
+        print(f"{name}: {', '.join(sorted(db[name].index_information()))}")
+    if args.stats:
+        for row in index_usage(db, collections):
+            unused = "  (unused)" if not row["ops"] and row["index"] != "_id_" else ""
+            print(f"{row['collection']:<15} {row['index']:<20} {row['ops']:>10} ops since {row['since']:%Y-%m-%d %H:%M}{unused}")
+
+
+if __name__ == "__main__":
+    main()
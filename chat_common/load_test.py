@@ -0,0 +1,132 @@
+# load_test.py
+# Load driver for the chat call path, meant to run against chat_common.mock_server.
+#
+#   python -m chat_common.mock_server --port 8765 &
+#   python -m chat_common.load_test --url http://127.0.0.1:8765/api/v1/chat/completions --sessions 50
+#
+# Each session is a thread, the way Streamlit runs one script thread per
+# browser session. Streams go through async_stream.stream_chunks and titles
+# through openrouter.complete, which are the calls behind stream_ai_response
+# and generate_chat_title in the apps.
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chat_common import openrouter, async_stream, resilience, router
+from chat_common.cache import cache_key
+
+
+def percentile(samples, p):
+    if not samples:
+        return float("nan")
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(len(samples) * p / 100))]
+
+
+class Results:
+    def __init__(self):
+        self.ttft = []
+        self.stream_seconds = []
+        self.title_seconds = []
+        self.deltas = 0
+        self.errors = {}
+        self._lock = threading.Lock()
+
+    def add(self, name, value):
+        with self._lock:
+            getattr(self, name).append(value)
+
+    def add_deltas(self, count):
+        with self._lock:
+            self.deltas += count
+
+    def error(self, e):
+        with self._lock:
+            key = type(e).__name__
+            self.errors[key] = self.errors.get(key, 0) + 1
+
+
+def run_session(session, turns, args, results):
+    headers = openrouter.build_headers(args.api_key or "mock-key")
+    messages = [{"role": "system", "content": "You are a helpful assistant."}]
+    for turn in range(turns):
+        prompt = "same question" if args.same_prompt else f"session {session} question {turn}"
+        messages.append({"role": "user", "content": prompt})
+        data = {"model": args.models[0], "messages": messages, "temperature": 0.7}
+
+        started = time.perf_counter()
+        first = None
+        parts = []
+        try:
+            for chunk in async_stream.stream_chunks(data, url=args.url, headers=headers,
+                                                    models=args.models if len(args.models) > 1 else None,
+                                                    coalesce=args.same_prompt):
+                delta = async_stream.chunk_content(chunk)
+                if delta:
+                    if first is None:
+                        first = time.perf_counter() - started
+                    parts.append(delta)
+            results.add("stream_seconds", time.perf_counter() - started)
+            if first is not None:
+                results.add("ttft", first)
+            results.add_deltas(len(parts))
+        except Exception as e:
+            results.error(e)
+        messages.append({"role": "assistant", "content": "".join(parts)})
+
+        if turn == 0 and args.titles:
+            title_data = {
+                "model": args.models[0],
+                "messages": [
+                    {"role": "system", "content": "Generate a concise and descriptive title for this conversation:"},
+                    {"role": "user", "content": prompt}
+                ],
+                "temperature": 0.3,
+                "max_tokens": 30
+            }
+            started = time.perf_counter()
+            try:
+                openrouter.completion_calls.call(
+                    cache_key(title_data), lambda: openrouter.complete(title_data, url=args.url, headers=headers)
+                )
+                results.add("title_seconds", time.perf_counter() - started)
+            except Exception as e:
+                results.error(e)
+
+
+def report(results, elapsed, args):
+    streams = len(results.stream_seconds)
+    print(f"{args.sessions} sessions x {args.turns} turns in {elapsed:.2f}s")
+    print(f"streams ok      : {streams}  ({streams / elapsed:.1f}/s, {results.deltas / elapsed:,.0f} deltas/s)")
+    for name, samples in (("ttft", results.ttft), ("stream", results.stream_seconds), ("title", results.title_seconds)):
+        if samples:
+            print(f"{name:<15} : p50 {percentile(samples, 50) * 1000:7.0f} ms  "
+                  f"p90 {percentile(samples, 90) * 1000:7.0f} ms  p99 {percentile(samples, 99) * 1000:7.0f} ms")
+    print(f"errors          : {results.errors or 'none'}")
+    print(f"provider        : {resilience.snapshot()}")
+    if len(args.models) > 1:
+        print(f"router          : {router.snapshot()}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load driver for the chat completion path")
+    parser.add_argument("--url", default=openrouter.get_api_url())
+    parser.add_argument("--api-key", default=None)
+    parser.add_argument("--sessions", type=int, default=20, help="concurrent chat sessions")
+    parser.add_argument("--turns", type=int, default=3, help="messages sent per session")
+    parser.add_argument("--models", default=openrouter.DEFAULT_MODEL, help="comma separated; more than one enables the router")
+    parser.add_argument("--no-titles", dest="titles", action="store_false", help="skip the title request")
+    parser.add_argument("--same-prompt", action="store_true", help="send identical prompts to exercise coalescing")
+    args = parser.parse_args()
+    args.models = [m.strip() for m in args.models.split(",") if m.strip()]
+
+    results = Results()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.sessions) as pool:
+        for session in range(args.sessions):
+            pool.submit(run_session, session, args.turns, args, results)
+    report(results, time.perf_counter() - started, args)
+
+
+if __name__ == "__main__":
+    main()
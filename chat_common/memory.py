@@ -0,0 +1,78 @@
+# memory.py
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from chat_common import openrouter
+
+# --- Configuration ---
+# Refresh once this many messages sit between the summary and the recent window
+SUMMARY_TRIGGER_MESSAGES = int(os.getenv("SUMMARY_TRIGGER_MESSAGES", "20"))
+# Newest messages that are always sent verbatim and never folded into the summary
+SUMMARY_KEEP_RECENT = int(os.getenv("SUMMARY_KEEP_RECENT", "8"))
+SUMMARY_MAX_TOKENS = 400
+
+SUMMARY_PROMPT = (
+    "You maintain a running summary of a conversation between a user and an assistant. "
+    "Update the existing summary with the new messages. Keep facts, decisions, names, code "
+    "identifiers and open questions; drop pleasantries. Answer with the summary only."
+)
+
+_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+_pending = set()
+_pending_lock = threading.Lock()
+
+
+def with_summary(messages, summary, summarized_count):
+    """Split a history into (pinned summary messages, the turns it does not cover yet).
+
+    The summary goes to build_context as pinned, so trimming never drops it.
+    """
+    if not summary:
+        return [], messages
+    note = {"role": "system", "content": f"Summary of the earlier conversation:\n{summary}"}
+    return [note], messages[summarized_count:]
+
+
+def summarize(previous_summary, messages, model=openrouter.DEFAULT_MODEL, url=None, headers=None):
+    transcript = "\n".join(f"{m['role'].capitalize()}: {m['content']}" for m in messages)
+    data = {
+        "model": model,
+        "messages": [
+            {"role": "system", "content": SUMMARY_PROMPT},
+            {"role": "user", "content": f"Existing summary:\n{previous_summary or '(none)'}\n\nNew messages:\n{transcript}"}
+        ],
+        "temperature": 0.2,
+        "max_tokens": SUMMARY_MAX_TOKENS
+    }
+    return openrouter.complete(data, url=url, headers=headers)
+
+
+def maybe_refresh_summary(chat_id, messages, summary, summarized_count, save, url=None, headers=None):
+    """Fold older messages into the summary in the background once the unsummarized tail is long enough.
+
+    save(chat_id, summary, summarized_count) persists the result. Returns True
+    when a refresh was scheduled.
+    """
+    upto = len(messages) - SUMMARY_KEEP_RECENT
+    if upto - summarized_count < SUMMARY_TRIGGER_MESSAGES:
+        return False
+    with _pending_lock:
+        if chat_id in _pending:
+            return False
+        _pending.add(chat_id)
+
+    older = [{"role": m["role"], "content": m["content"]} for m in messages[summarized_count:upto]]
+
+    def _refresh():
+        try:
+            new_summary = summarize(summary, older, url=url, headers=headers)
+            if new_summary:
+                save(chat_id, new_summary, upto)
+        except Exception as e:
+            print(f"Summary refresh for chat {chat_id} failed: {e}")
+        finally:
+            with _pending_lock:
+                _pending.discard(chat_id)
+
+    _executor.submit(_refresh)
+    return True
@@ -0,0 +1,186 @@
+# mock_server.py
+# Local stand-in for the OpenRouter /chat/completions endpoint, for load tests.
+#
+#   python -m chat_common.mock_server --port 8765 --ttft 0.4 --tps 40
+#   OPENROUTER_URL=http://127.0.0.1:8765/api/v1/chat/completions streamlit run chat_6_1/app.py
+import json
+import time
+import random
+import argparse
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+WORDS = ("the quick brown fox jumps over a lazy dog while streaming tokens "
+         "from a local mock of the chat completions endpoint").split()
+
+
+class MockConfig:
+    def __init__(self, ttft=0.3, tps=50.0, tokens=120, chunk_tokens=1, usage=True,
+                 error_rate=0.0, burst_every=0, burst_length=0, model_ttft=None):
+        self.ttft = ttft
+        self.tps = tps
+        self.tokens = tokens
+        self.chunk_tokens = chunk_tokens
+        self.usage = usage
+        self.error_rate = error_rate
+        # Every burst_every-th request starts a run of burst_length 429 responses
+        self.burst_every = burst_every
+        self.burst_length = burst_length
+        self.model_ttft = model_ttft or {}
+        self.requests = 0
+        self._burst_left = 0
+        self._lock = threading.Lock()
+
+    def next_fault(self):
+        """Return an HTTP status to fail this request with, or None"""
+        with self._lock:
+            self.requests += 1
+            if self.burst_every and self.requests % self.burst_every == 0:
+                self._burst_left = self.burst_length
+            if self._burst_left:
+                self._burst_left -= 1
+                return 429
+        if self.error_rate and random.random() < self.error_rate:
+            return 500
+        return None
+
+
+def _completion_text(tokens):
+    return [" " + WORDS[i % len(WORDS)] for i in range(tokens)]
+
+
+def _prompt_tokens(body):
+    return sum(len(str(m.get("content", "")).split()) + 4 for m in body.get("messages", []))
+
+
+class MockHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    config = MockConfig()
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_HEAD(self):
+        self.send_response(200)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def do_GET(self):
+        self._send_json(200, {"status": "ok", "requests": self.config.requests})
+
+    def do_POST(self):
+        if not self.path.rstrip("/").endswith("chat/completions"):
+            self._send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+        length = int(self.headers.get("Content-Length", 0))
+        body = json.loads(self.rfile.read(length) or b"{}")
+        config = self.config
+
+        fault = config.next_fault()
+        if fault == 429:
+            self._send_json(429, {"error": {"message": "Rate limit exceeded (mock)"}}, {"Retry-After": "1"})
+            return
+        if fault:
+            self._send_json(fault, {"error": {"message": "Upstream error (mock)"}})
+            return
+
+        model = body.get("model", "mock")
+        tokens = min(config.tokens, body.get("max_tokens") or config.tokens)
+        pieces = _completion_text(tokens)
+        usage = {"prompt_tokens": _prompt_tokens(body), "completion_tokens": tokens,
+                 "total_tokens": _prompt_tokens(body) + tokens}
+        time.sleep(config.model_ttft.get(model, config.ttft))
+
+        if not body.get("stream"):
+            time.sleep(tokens / config.tps)
+            result = {
+                "id": "gen-mock", "object": "chat.completion", "model": model,
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": "".join(pieces).strip()},
+                             "finish_reason": "stop"}]
+            }
+            if config.usage:
+                result["usage"] = usage
+            self._send_json(200, result)
+            return
+
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        try:
+            self._write_event(b": OPENROUTER PROCESSING")
+            step = max(1, config.chunk_tokens)
+            for i in range(0, len(pieces), step):
+                chunk = {"id": "gen-mock", "object": "chat.completion.chunk", "model": model,
+                         "choices": [{"index": 0, "delta": {"role": "assistant", "content": "".join(pieces[i:i + step])}}]}
+                self._write_event(b"data: " + json.dumps(chunk).encode("utf-8"))
+                time.sleep(step / config.tps)
+            final = {"id": "gen-mock", "object": "chat.completion.chunk", "model": model,
+                     "choices": [{"index": 0, "delta": {}, "finish_reason": "stop"}]}
+            if config.usage:
+                final["usage"] = usage
+            self._write_event(b"data: " + json.dumps(final).encode("utf-8"))
+            self._write_event(b"data: [DONE]")
+            self.wfile.write(b"0\r\n\r\n")
+        except (BrokenPipeError, ConnectionResetError):
+            pass
+
+    def _write_event(self, line):
+        event = line + b"\n\n"
+        self.wfile.write(f"{len(event):x}\r\n".encode("ascii") + event + b"\r\n")
+        self.wfile.flush()
+
+    def _send_json(self, status, payload, headers=None):
+        encoded = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(encoded)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(encoded)
+
+
+def serve(config, host="127.0.0.1", port=8765):
+    """Start the mock in a background thread and return the server (call .shutdown() to stop)"""
+    handler = type("ConfiguredMockHandler", (MockHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Mock OpenRouter chat completions server")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--ttft", type=float, default=0.3, help="seconds before the first token")
+    parser.add_argument("--tps", type=float, default=50.0, help="tokens streamed per second")
+    parser.add_argument("--tokens", type=int, default=120, help="completion length in tokens")
+    parser.add_argument("--chunk-tokens", type=int, default=1, help="tokens per SSE event")
+    parser.add_argument("--no-usage", action="store_true", help="omit the usage payload")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 500")
+    parser.add_argument("--burst-every", type=int, default=0, help="start a 429 burst every N requests")
+    parser.add_argument("--burst-length", type=int, default=0, help="429 responses per burst")
+    parser.add_argument("--model-ttft", action="append", default=[], metavar="MODEL=SECONDS",
+                        help="per-model time to first token, e.g. to exercise the router")
+    args = parser.parse_args()
+
+    model_ttft = {}
+    for item in args.model_ttft:
+        model, _, seconds = item.rpartition("=")
+        model_ttft[model] = float(seconds)
+    config = MockConfig(ttft=args.ttft, tps=args.tps, tokens=args.tokens, chunk_tokens=args.chunk_tokens,
+                        usage=not args.no_usage, error_rate=args.error_rate, burst_every=args.burst_every,
+                        burst_length=args.burst_length, model_ttft=model_ttft)
+    server = serve(config, args.host, args.port)
+    print(f"Mock OpenRouter listening on http://{args.host}:{args.port}/api/v1/chat/completions")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
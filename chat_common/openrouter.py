@@ -0,0 +1,93 @@
+# openrouter.py
+import os
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+from chat_common.coalesce import CallCoalescer
+from chat_common import resilience
+
+load_dotenv()
+
+# --- Configuration ---
+DEFAULT_URL = "https://openrouter.ai/api/v1/chat/completions"
+DEFAULT_MODEL = "deepseek/deepseek-r1-0528:free"
+YOUR_SITE_URL = "https://your-site.com"
+YOUR_SITE_NAME = "MyAIApp"
+
+POOL_CONNECTIONS = int(os.getenv("OPENROUTER_POOL_CONNECTIONS", "4"))
+POOL_MAXSIZE = int(os.getenv("OPENROUTER_POOL_MAXSIZE", "16"))
+
+# The session lives at module level, so it survives Streamlit reruns
+# (the app script is re-executed, imported modules are not).
+_session = None
+_session_lock = threading.Lock()
+_warmed_urls = set()
+
+# Concurrent identical non-streaming requests (e.g. titling the same first message) share one call
+completion_calls = CallCoalescer()
+
+
+def get_api_url():
+    return (os.getenv("OPENROUTER_URL") or DEFAULT_URL).strip()
+
+
+def build_headers(api_key=None):
+    return {
+        "Authorization": f"Bearer {api_key or os.getenv('OPENROUTER_API_KEY')}",
+        "Content-Type": "application/json",
+        "HTTP-Referer": YOUR_SITE_URL,
+        "X-Title": YOUR_SITE_NAME
+    }
+
+
+def get_session():
+    """Return the shared keep-alive session, creating it on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=POOL_CONNECTIONS, pool_maxsize=POOL_MAXSIZE)
+                session.mount("https://", adapter)
+                session.mount("http://", adapter)
+                _session = session
+    return _session
+
+
+def post(data, stream=False, url=None, headers=None, **kwargs):
+    url = (url or get_api_url()).strip()
+    return get_session().post(url, headers=headers or build_headers(), json=data, stream=stream, **kwargs)
+
+
+def complete(data, url=None, headers=None):
+    """Non-streaming completion with timeouts and retries; returns the reply text and raises on failure"""
+    url = (url or get_api_url()).strip()
+
+    def _request():
+        response = post({**data, "stream": False}, url=url, headers=headers,
+                        timeout=(resilience.CONNECT_TIMEOUT, resilience.READ_TIMEOUT))
+        response.raise_for_status()
+        return response.json()
+
+    result = resilience.call_with_retries(_request, name=url)
+    return result['choices'][0]['message']['content'].strip()
+
+
+def warm_up(url=None, background=True):
+    """Open a pooled connection to the provider so the first chat skips the TLS handshake"""
+    url = (url or get_api_url()).strip()
+    if url in _warmed_urls:
+        return
+    _warmed_urls.add(url)
+
+    def _warm():
+        try:
+            get_session().head(url, timeout=5)
+        except requests.exceptions.RequestException as e:
+            print(f"OpenRouter warm-up failed: {e}")
+
+    if background:
+        threading.Thread(target=_warm, daemon=True).start()
+    else:
+        _warm()
@@ -0,0 +1,166 @@
+# ratelimit.py
+import os
+import time
+import threading
+from pymongo import ReturnDocument
+
+# --- Configuration ---
+# Limits are per minute and double as the burst size
+USER_REQUESTS_PER_MINUTE = float(os.getenv("USER_REQUESTS_PER_MINUTE", "10"))
+USER_TOKENS_PER_MINUTE = float(os.getenv("USER_TOKENS_PER_MINUTE", "40000"))
+GLOBAL_REQUESTS_PER_MINUTE = float(os.getenv("GLOBAL_REQUESTS_PER_MINUTE", "20"))
+GLOBAL_TOKENS_PER_MINUTE = float(os.getenv("GLOBAL_TOKENS_PER_MINUTE", "200000"))
+# Requests that would be allowed within this many seconds wait; later ones are rejected
+RATE_LIMIT_QUEUE_SECONDS = float(os.getenv("RATE_LIMIT_QUEUE_SECONDS", "5"))
+# Completion tokens reserved per request on top of the counted prompt
+EXPECTED_COMPLETION_TOKENS = int(os.getenv("EXPECTED_COMPLETION_TOKENS", "1000"))
+
+
+class RateLimitedError(Exception):
+    def __init__(self, scope, retry_after):
+        super().__init__(f"Rate limit reached ({scope}); try again in {retry_after:.0f}s")
+        self.scope = scope
+        self.retry_after = retry_after
+
+
+class TokenBucket:
+    """In-process bucket, also used as the fast path in front of the shared one"""
+
+    def __init__(self, capacity, per_second):
+        self.capacity = capacity
+        self.per_second = per_second
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.per_second)
+        self.updated_at = now
+
+    def take(self, amount):
+        """Take amount if available; return 0 on success or the seconds until it would be"""
+        with self._lock:
+            self._refill()
+            if self.tokens >= amount:
+                self.tokens -= amount
+                return 0
+            return (amount - self.tokens) / self.per_second
+
+    def give(self, amount):
+        with self._lock:
+            self._refill()
+            self.tokens = min(self.capacity, self.tokens + amount)
+
+
+class MongoBucket:
+    """Bucket shared by every server process, updated atomically in one round trip"""
+
+    def __init__(self, collection, key, capacity, per_second):
+        self.collection = collection
+        self.key = key
+        self.capacity = capacity
+        self.per_second = per_second
+
+    def _update(self, pipeline_tail):
+        now = time.time()
+        refilled = {"$min": [self.capacity, {"$add": [
+            {"$ifNull": ["$tokens", self.capacity]},
+            {"$multiply": [{"$subtract": [now, {"$ifNull": ["$updated_at", now]}]}, self.per_second]}
+        ]}]}
+        return self.collection.find_one_and_update(
+            {"_id": self.key},
+            [{"$set": {"refilled": refilled}}, *pipeline_tail, {"$set": {"updated_at": now}}, {"$unset": "refilled"}],
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+
+    def take(self, amount):
+        doc = self._update([
+            {"$set": {"granted": {"$gte": ["$refilled", amount]}}},
+            {"$set": {"tokens": {"$cond": ["$granted", {"$subtract": ["$refilled", amount]}, "$refilled"]}}}
+        ])
+        if doc["granted"]:
+            return 0
+        return (amount - doc["tokens"]) / self.per_second
+
+    def give(self, amount):
+        self._update([{"$set": {"tokens": {"$min": [self.capacity, {"$add": ["$refilled", amount]}]}}}])
+
+
+class RateLimiter:
+    """Per-user and global token buckets counted in requests and in estimated tokens.
+
+    Each bucket is checked in-process first, so a flooding user is turned
+    away without a database round trip; the Mongo copy then enforces the
+    limit across server processes. Without a collection only the local
+    buckets apply.
+    """
+
+    def __init__(self, collection=None):
+        self.collection = collection
+        self._local = {}
+        self._lock = threading.Lock()
+
+    def _limits(self, email, tokens):
+        return [
+            (f"user:{email}:requests", USER_REQUESTS_PER_MINUTE, 1),
+            (f"user:{email}:tokens", USER_TOKENS_PER_MINUTE, tokens),
+            ("global:requests", GLOBAL_REQUESTS_PER_MINUTE, 1),
+            ("global:tokens", GLOBAL_TOKENS_PER_MINUTE, tokens),
+        ]
+
+    def _buckets(self, key, per_minute):
+        with self._lock:
+            if key not in self._local:
+                shared = MongoBucket(self.collection, key, per_minute, per_minute / 60) if self.collection is not None else None
+                self._local[key] = (TokenBucket(per_minute, per_minute / 60), shared)
+            return self._local[key]
+
+    def try_acquire(self, email, tokens):
+        """Take from every bucket or from none; return 0 or the wait in seconds and the limiting scope"""
+        taken = []
+        for key, per_minute, amount in self._limits(email, tokens):
+            amount = min(amount, per_minute)  # a single oversized prompt still fits an empty bucket
+            local, shared = self._buckets(key, per_minute)
+            wait = local.take(amount)
+            if not wait and shared is not None:
+                try:
+                    wait = shared.take(amount)
+                except Exception as e:
+                    print(f"Shared rate limit unavailable, using local bucket only: {e}")
+                    shared = None
+                if wait:
+                    local.give(amount)
+            if wait:
+                for bucket, given in taken:
+                    bucket.give(given)
+                return wait, key
+            taken.append((local, amount))
+            if shared is not None:
+                taken.append((shared, amount))
+        return 0, None
+
+    def acquire(self, email, tokens, max_wait=RATE_LIMIT_QUEUE_SECONDS):
+        """Block until the request fits, or raise RateLimitedError if that would take longer than max_wait"""
+        deadline = time.monotonic() + max_wait
+        while True:
+            wait, scope = self.try_acquire(email, tokens)
+            if not wait:
+                return
+            if time.monotonic() + wait > deadline:
+                raise RateLimitedError(scope, wait)
+            time.sleep(wait)
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(collection=None):
+    """Process-wide limiter, so buckets survive Streamlit reruns"""
+    key = None if collection is None else collection.full_name
+    with _limiters_lock:
+        if key not in _limiters:
+            _limiters[key] = RateLimiter(collection)
+        return _limiters[key]
@@ -0,0 +1,58 @@
+# render.py
+import os
+import time
+
+# --- Configuration ---
+# Redraws per second while an answer is streaming in
+STREAM_RENDER_FPS = float(os.getenv("STREAM_RENDER_FPS", "10"))
+# Redraw early once this many characters are waiting, so large chunks show promptly
+STREAM_RENDER_FLUSH_CHARS = int(os.getenv("STREAM_RENDER_FLUSH_CHARS", "1024"))
+
+
+class StreamRenderer:
+    """Buffers streamed chunks and redraws a Streamlit placeholder at a bounded rate.
+
+    Each redraw re-renders the whole markdown and pushes it to the browser,
+    so doing it per token costs far more than the token itself. Chunks are
+    kept in a list and joined only when a frame is due.
+    """
+
+    def __init__(self, placeholder, cursor="▌", template="{text}", fps=STREAM_RENDER_FPS,
+                 flush_chars=STREAM_RENDER_FLUSH_CHARS, **markdown_kwargs):
+        self.placeholder = placeholder
+        self.cursor = cursor
+        self.template = template
+        self.interval = 1 / fps if fps > 0 else 0
+        self.flush_chars = flush_chars
+        self.markdown_kwargs = markdown_kwargs
+        self.parts = []
+        self.pending = 0
+        self.frames = 0
+        self.last_flush = time.monotonic()
+
+    @property
+    def text(self):
+        if len(self.parts) > 1:
+            self.parts = ["".join(self.parts)]
+        return self.parts[0] if self.parts else ""
+
+    def write(self, chunk):
+        if not chunk:
+            return
+        self.parts.append(chunk)
+        self.pending += len(chunk)
+        if self.pending >= self.flush_chars or time.monotonic() - self.last_flush >= self.interval:
+            self.flush()
+
+    def flush(self, cursor=True):
+        self.placeholder.markdown(
+            self.template.format(text=self.text + (self.cursor if cursor else "")), **self.markdown_kwargs
+        )
+        self.pending = 0
+        self.frames += 1
+        self.last_flush = time.monotonic()
+
+    def finish(self):
+        """Draw the complete answer without the cursor and return it"""
+        self.flush(cursor=False)
+        return self.text
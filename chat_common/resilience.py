@@ -0,0 +1,315 @@
+# resilience.py
+import os
+import time
+import random
+import asyncio
+import threading
+from collections import deque
+import httpx
+
+# --- Configuration ---
+CONNECT_TIMEOUT = float(os.getenv("OPENROUTER_CONNECT_TIMEOUT", "10"))
+# Longest silence allowed between two reads of a response
+READ_TIMEOUT = float(os.getenv("OPENROUTER_READ_TIMEOUT", "60"))
+MAX_RETRIES = int(os.getenv("OPENROUTER_MAX_RETRIES", "3"))
+BACKOFF_BASE = float(os.getenv("OPENROUTER_BACKOFF_BASE", "0.5"))
+BACKOFF_MAX = float(os.getenv("OPENROUTER_BACKOFF_MAX", "8"))
+# Start a second, identical request if the first has produced nothing after this many seconds (0 = off)
+HEDGE_AFTER = float(os.getenv("OPENROUTER_HEDGE_AFTER", "0"))
+BREAKER_FAILURES = int(os.getenv("OPENROUTER_BREAKER_FAILURES", "5"))
+BREAKER_RESET_SECONDS = float(os.getenv("OPENROUTER_BREAKER_RESET_SECONDS", "30"))
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+
+class CircuitOpenError(httpx.HTTPError):
+    """Raised without calling the provider while its circuit breaker is open"""
+
+
+# --- Circuit Breaker ---
+class CircuitBreaker:
+    """Opens after consecutive failures, then lets a single probe through once the reset time has passed.
+
+    A probe that has not reported back within another reset period is
+    treated as lost, so a stuck probe cannot keep the breaker shut.
+    """
+
+    def __init__(self, failure_threshold=BREAKER_FAILURES, reset_seconds=BREAKER_RESET_SECONDS):
+        self.failure_threshold = failure_threshold
+        self.reset_seconds = reset_seconds
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self.probe_started = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        if time.monotonic() - self.opened_at >= self.reset_seconds:
+            return "half_open"
+        return "open"
+
+    def allow(self):
+        with self._lock:
+            state = self.state
+            if state == "closed":
+                return True
+            if state == "half_open" and (not self.probing or
+                                         time.monotonic() - self.probe_started >= self.reset_seconds):
+                self.probing = True
+                self.probe_started = time.monotonic()
+                return True
+            return False
+
+    def release(self):
+        """End a probe abandoned before any outcome, so the next request can probe"""
+        with self._lock:
+            self.probing = False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+# --- Metrics ---
+class Metrics:
+    def __init__(self, window=1000):
+        self.counters = {
+            "requests": 0, "retries": 0, "hedges": 0, "hedge_wins": 0,
+            "failures": 0, "circuit_rejections": 0
+        }
+        self.first_byte_seconds = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def incr(self, name, value=1):
+        with self._lock:
+            self.counters[name] += value
+
+    def observe(self, seconds):
+        with self._lock:
+            self.first_byte_seconds.append(seconds)
+
+    def snapshot(self):
+        with self._lock:
+            samples = sorted(self.first_byte_seconds)
+            snapshot = dict(self.counters)
+        for p in (50, 90, 99):
+            snapshot[f"ttft_p{p}"] = samples[min(len(samples) - 1, int(len(samples) * p / 100))] if samples else None
+        return snapshot
+
+
+_breakers = {}
+_metrics = {}
+_registry_lock = threading.Lock()
+
+
+def get_breaker(name):
+    with _registry_lock:
+        if name not in _breakers:
+            _breakers[name] = CircuitBreaker()
+        return _breakers[name]
+
+
+def get_metrics(name):
+    with _registry_lock:
+        if name not in _metrics:
+            _metrics[name] = Metrics()
+        return _metrics[name]
+
+
+def snapshot():
+    """Metrics and breaker state of every upstream seen so far"""
+    with _registry_lock:
+        names = set(_metrics) | set(_breakers)
+    return {
+        name: {**get_metrics(name).snapshot(), "circuit": get_breaker(name).state}
+        for name in sorted(names)
+    }
+
+
+# --- Retry policy ---
+def _status(error):
+    response = getattr(error, "response", None)
+    return getattr(response, "status_code", None)
+
+
+def is_retryable(error):
+    if isinstance(error, CircuitOpenError):
+        return False
+    status = _status(error)
+    if status is not None:
+        return status in RETRY_STATUSES
+    return isinstance(error, (httpx.TransportError, OSError))
+
+
+def _record_outcome(breaker, error):
+    # Client errors such as 400 or 401 mean the provider is up; only count what retries are for
+    if is_retryable(error):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+
+def backoff_delay(attempt, error=None):
+    """Full-jitter exponential backoff, honouring Retry-After when the provider sends it"""
+    response = getattr(error, "response", None)
+    retry_after = response.headers.get("Retry-After") if response is not None else None
+    if retry_after:
+        try:
+            return min(BACKOFF_MAX, float(retry_after))
+        except ValueError:
+            pass
+    return random.uniform(0, min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt))
+
+
+# --- Async streams ---
+async def _discard(agen, task):
+    task.cancel()
+    try:
+        await task
+    except BaseException:
+        pass
+    await agen.aclose()
+
+
+async def _first_item(open_stream, hedge_after, metrics):
+    """Open a stream and wait for its first item, hedging with a second stream if it is slow.
+
+    Returns (stream, first_task); the task holds the first item or StopAsyncIteration.
+    """
+    racers = {}
+    try:
+        return await _race(open_stream, hedge_after, metrics, racers)
+    except BaseException:
+        # Cancelled while waiting: do not leave the attempts running
+        for task, stream in racers.items():
+            await _discard(stream, task)
+        raise
+
+
+async def _race(open_stream, hedge_after, metrics, racers):
+    primary = open_stream()
+    primary_task = asyncio.ensure_future(primary.__anext__())
+    racers[primary_task] = primary
+    if not hedge_after:
+        await asyncio.wait({primary_task})
+        return primary, primary_task
+    done, _ = await asyncio.wait({primary_task}, timeout=hedge_after)
+    if done:
+        return primary, primary_task
+
+    metrics.incr("hedges")
+    secondary = open_stream()
+    secondary_task = asyncio.ensure_future(secondary.__anext__())
+    racers[secondary_task] = secondary
+    pending = set(racers)
+    winner = None
+    while pending and winner is None:
+        done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+        succeeded = [task for task in done if task.exception() is None]
+        if succeeded:
+            winner = succeeded[0]
+        elif not pending:
+            winner = done.pop()
+    for task, stream in list(racers.items()):
+        if task is not winner:
+            del racers[task]
+            await _discard(stream, task)
+    if winner is secondary_task:
+        metrics.incr("hedge_wins")
+    return racers[winner], winner
+
+
+async def resilient_stream(open_stream, name, hedge_after=HEDGE_AFTER, max_retries=MAX_RETRIES):
+    """Wrap an async stream factory with a circuit breaker, retries and hedging.
+
+    Retries and hedges only happen before the first item, so a caller never
+    sees output from two different attempts.
+    """
+    breaker = get_breaker(name)
+    metrics = get_metrics(name)
+    if not breaker.allow():
+        metrics.incr("circuit_rejections")
+        raise CircuitOpenError(f"{name} is failing; not sending requests for now")
+
+    metrics.incr("requests")
+    started = time.monotonic()
+    attempt = 0
+    recorded = False
+    try:
+        while True:
+            stream, first = await _first_item(open_stream, hedge_after, metrics)
+            error = first.exception()
+            if error is None or isinstance(error, StopAsyncIteration):
+                break
+            await stream.aclose()
+            if attempt < max_retries and is_retryable(error):
+                metrics.incr("retries")
+                await asyncio.sleep(backoff_delay(attempt, error))
+                attempt += 1
+                continue
+            metrics.incr("failures")
+            _record_outcome(breaker, error)
+            recorded = True
+            raise error
+    except BaseException:
+        # Cancelled or closed before the provider answered (user left, coalescer or router gave up):
+        # that says nothing about its health, but a half-open probe must not stay taken
+        if not recorded:
+            breaker.release()
+        raise
+
+    # The provider has answered, so it counts as healthy from here on
+    metrics.observe(time.monotonic() - started)
+    breaker.record_success()
+    try:
+        if error is None:
+            yield first.result()
+            async for item in stream:
+                yield item
+    except Exception as e:
+        metrics.incr("failures")
+        _record_outcome(breaker, e)
+        raise
+    finally:
+        await stream.aclose()
+
+
+# --- Blocking calls ---
+def call_with_retries(fn, name, max_retries=MAX_RETRIES):
+    """Run a blocking request under the same breaker, retry policy and metrics as the streams"""
+    breaker = get_breaker(name)
+    metrics = get_metrics(name)
+    if not breaker.allow():
+        metrics.incr("circuit_rejections")
+        raise CircuitOpenError(f"{name} is failing; not sending requests for now")
+
+    metrics.incr("requests")
+    started = time.monotonic()
+    attempt = 0
+    while True:
+        try:
+            result = fn()
+        except Exception as e:
+            if attempt < max_retries and is_retryable(e):
+                metrics.incr("retries")
+                time.sleep(backoff_delay(attempt, e))
+                attempt += 1
+                continue
+            metrics.incr("failures")
+            _record_outcome(breaker, e)
+            raise
+        metrics.observe(time.monotonic() - started)
+        breaker.record_success()
+        return result
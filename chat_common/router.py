@@ -0,0 +1,152 @@
+# router.py
+import os
+import time
+import asyncio
+import threading
+import httpx
+from chat_common import openrouter, resilience
+
+# --- Configuration ---
+# Ordered candidates, most preferred first
+MODELS = [m.strip() for m in os.getenv("OPENROUTER_MODELS", openrouter.DEFAULT_MODEL).split(",") if m.strip()]
+# Give up on a model that has produced nothing after this long and try the next one
+STALL_SECONDS = float(os.getenv("ROUTER_STALL_SECONDS", "15"))
+# Retries per candidate before failing over; the next model is usually the faster fix
+RETRIES_PER_MODEL = int(os.getenv("ROUTER_RETRIES_PER_MODEL", "1"))
+# Weight of the newest sample in the rolling averages
+SMOOTHING = 0.2
+# Assumed time to first token of a model that has not been measured yet
+UNMEASURED_TTFT = 2.0
+ERROR_PENALTY = 4.0
+
+
+class ModelStats:
+    """Rolling time to first token and error rate of one model"""
+
+    def __init__(self):
+        self.ttft = None
+        self.error_rate = 0.0
+        self.requests = 0
+        self.failovers = 0
+        self._lock = threading.Lock()
+
+    def record_success(self, ttft):
+        with self._lock:
+            self.requests += 1
+            self.ttft = ttft if self.ttft is None else (1 - SMOOTHING) * self.ttft + SMOOTHING * ttft
+            self.error_rate *= (1 - SMOOTHING)
+
+    def record_failure(self, stalled=False):
+        with self._lock:
+            self.requests += 1
+            self.error_rate = (1 - SMOOTHING) * self.error_rate + SMOOTHING
+            if stalled:
+                self.failovers += 1
+
+    def score(self):
+        """Expected seconds to first token, inflated by recent errors; lower is better"""
+        ttft = UNMEASURED_TTFT if self.ttft is None else self.ttft
+        return ttft * (1 + ERROR_PENALTY * self.error_rate)
+
+
+_stats = {}
+_stats_lock = threading.Lock()
+
+
+def get_stats(model):
+    with _stats_lock:
+        if model not in _stats:
+            _stats[model] = ModelStats()
+        return _stats[model]
+
+
+def breaker_name(url, model):
+    return f"{url}#{model}"
+
+
+def rank(models, url):
+    """Healthy candidates fastest first, then the ones whose breaker is open as a last resort"""
+    url = url.strip()
+    healthy = [m for m in models if resilience.get_breaker(breaker_name(url, m)).state != "open"]
+    unhealthy = [m for m in models if m not in healthy]
+    order = {m: i for i, m in enumerate(models)}
+    healthy.sort(key=lambda m: (get_stats(m).score(), order[m]))
+    return healthy + unhealthy
+
+
+class StallError(httpx.TimeoutException):
+    """A candidate produced nothing within the stall window"""
+
+
+async def route_stream(models, open_model_stream, stall_seconds=STALL_SECONDS, url=None):
+    """Stream from the best candidate, failing over while nothing has been produced yet.
+
+    open_model_stream(model, last) returns an async iterator for one model;
+    last is True for the final candidate, which should get the full retry
+    policy since there is nothing left to fail over to. A candidate that
+    errors, or stalls for stall_seconds before its first item while another
+    one is left, is abandoned and the next one is tried; the last candidate
+    is only bound by the normal read timeout. Once output has started the
+    stream is committed to that model, so a reply never mixes two models.
+    With url, a stall also counts as a failure on that model's circuit breaker.
+    """
+    last_error = None
+    for i, model in enumerate(models):
+        stats = get_stats(model)
+        last = i == len(models) - 1
+        stream = open_model_stream(model, last).__aiter__()
+        started = time.monotonic()
+        try:
+            first = await asyncio.wait_for(stream.__anext__(), None if last else stall_seconds)
+        except StopAsyncIteration:
+            stats.record_success(time.monotonic() - started)
+            return
+        except asyncio.TimeoutError:
+            stats.record_failure(stalled=True)
+            if url is not None:
+                resilience.get_breaker(breaker_name(url, model)).record_failure()
+            last_error = StallError(f"{model} produced nothing in {stall_seconds:g}s")
+            print(f"Router: {last_error}; failing over")
+            await _close(stream)
+            continue
+        except resilience.CircuitOpenError as e:
+            last_error = e
+            await _close(stream)
+            continue
+        except Exception as e:
+            stats.record_failure()
+            last_error = e
+            print(f"Router: {model} failed ({e}); failing over")
+            await _close(stream)
+            continue
+
+        stats.record_success(time.monotonic() - started)
+        try:
+            yield first
+            async for item in stream:
+                yield item
+        finally:
+            await _close(stream)
+        return
+    raise last_error or RuntimeError("No candidate models configured")
+
+
+async def _close(stream):
+    aclose = getattr(stream, "aclose", None)
+    if aclose is not None:
+        await aclose()
+
+
+def snapshot():
+    with _stats_lock:
+        models = list(_stats)
+    return {
+        model: {
+            "ttft": get_stats(model).ttft,
+            "error_rate": round(get_stats(model).error_rate, 3),
+            "requests": get_stats(model).requests,
+            "failovers": get_stats(model).failovers,
+            "score": round(get_stats(model).score(), 3)
+        }
+        for model in models
+    }
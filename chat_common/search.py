@@ -0,0 +1,38 @@
+# search.py
+import re
+
+SNIPPET_CHARS = 160
+MAX_TERMS = 8
+
+
+def query_terms(query):
+    """Distinct words of a search query, longest first so longer matches win when highlighting"""
+    terms = {t.lower() for t in re.findall(r"\w+", query) if len(t) > 1}
+    return sorted(terms, key=len, reverse=True)[:MAX_TERMS]
+
+
+def terms_pattern(terms):
+    """Case-insensitive regex source matching any term as a word prefix (catches simple plurals and tenses)"""
+    return r"\b(" + "|".join(re.escape(t) for t in terms) + r")" if terms else None
+
+
+def make_snippet(text, terms, width=SNIPPET_CHARS):
+    """Cut a window of text around the first matching term and bold every match"""
+    text = " ".join(text.split())
+    pattern = terms_pattern(terms)
+    match = re.search(pattern, text, re.IGNORECASE) if pattern else None
+    if match is None:
+        snippet = text[:width]
+        return snippet + ("…" if len(text) > width else "")
+
+    start = max(0, match.start() - width // 3)
+    end = min(len(text), start + width)
+    start = max(0, end - width)
+    snippet = text[start:end]
+    # Do not cut words in half at the edges
+    if start > 0 and " " in snippet:
+        snippet = snippet[snippet.index(" ") + 1:]
+    if end < len(text) and " " in snippet:
+        snippet = snippet[:snippet.rindex(" ")]
+    snippet = re.sub(pattern, lambda m: f"**{m.group(0)}**", snippet, flags=re.IGNORECASE)
+    return ("…" if start > 0 else "") + snippet + ("…" if end < len(text) else "")
@@ -0,0 +1,170 @@
+# semantic_cache.py
+# Response cache that also answers paraphrases of earlier prompts
+# ("something about tiger" / "tell me something about tigers").
+import os
+import re
+import json
+import time
+import hashlib
+import threading
+import numpy as np
+from chat_common import embeddings
+from chat_common.cache import KEY_PARAMS, CACHE_TTL_SECONDS, replay
+
+# --- Configuration ---
+# SEMANTIC_CACHE=on enables it; it sits in front of the exact-match RESPONSE_CACHE
+SEMANTIC_CACHE = os.getenv("SEMANTIC_CACHE", "").strip().lower()
+# Cosine similarity a cached prompt needs to be served; lower serves more, and more wrongly
+SEMANTIC_CACHE_THRESHOLD = float(os.getenv("SEMANTIC_CACHE_THRESHOLD", "0.92"))
+SEMANTIC_CACHE_MAX_ENTRIES = int(os.getenv("SEMANTIC_CACHE_MAX_ENTRIES", "2048"))
+STATS_EVERY = 100
+
+
+def normalize(text):
+    """Case, spacing and trailing punctuation do not change what is being asked"""
+    return re.sub(r"[\s?!.]+$", "", " ".join(text.lower().split()))
+
+
+def split_prompt(data):
+    """(namespace, last user turn) of a completion request.
+
+    The namespace covers the model, the sampling parameters and every
+    message before the last user turn, so only the same question asked in
+    the same context can share an answer; a follow-up such as "explain more"
+    never matches one from another conversation.
+    """
+    messages = [{"role": m["role"], "content": m["content"]} for m in data.get("messages", [])]
+    last = max((i for i, m in enumerate(messages) if m["role"] == "user"), default=None)
+    if last is None:
+        return None, None
+    context = {
+        "model": data.get("model"),
+        "params": {k: data[k] for k in KEY_PARAMS if data.get(k) is not None},
+        "messages": messages[:last] + messages[last + 1:]
+    }
+    encoded = json.dumps(context, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(encoded.encode("utf-8")).digest(), normalize(messages[last]["content"])
+
+
+class SemanticCache:
+    """Prompt embeddings in one preallocated matrix, looked up with a single matrix-vector product.
+
+    A lookup scores every live entry of the request's namespace at once and
+    serves the best one above the threshold. When full, the least recently
+    used entry is overwritten; expired entries are skipped and reused first.
+    """
+
+    def __init__(self, threshold=SEMANTIC_CACHE_THRESHOLD, max_entries=SEMANTIC_CACHE_MAX_ENTRIES,
+                 ttl_seconds=CACHE_TTL_SECONDS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.vectors = None
+        # Namespace digest of each slot; empty marks a slot never used
+        self.namespaces = np.zeros(max_entries, dtype="S32")
+        self.expires_at = np.zeros(max_entries, dtype=np.float64)
+        self.last_used = np.zeros(max_entries, dtype=np.float64)
+        self.prompts = [None] * max_entries
+        self.responses = [None] * max_entries
+        self.stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0}
+        self._lock = threading.Lock()
+
+    def lookup(self, namespace, prompt, vector=None):
+        """Cached response for the closest prompt in namespace, or None"""
+        if vector is None:
+            vector = embeddings.embed([prompt])[0]
+        now = time.time()
+        with self._lock:
+            response = None
+            if self.vectors is not None:
+                live = np.flatnonzero((self.namespaces == namespace) & (self.expires_at > now))
+                if len(live):
+                    scores = self.vectors[live] @ vector
+                    best = int(np.argmax(scores))
+                    if scores[best] >= self.threshold:
+                        slot = live[best]
+                        self.last_used[slot] = now
+                        response = self.responses[slot]
+            self.stats["hits" if response is not None else "misses"] += 1
+            lookups = self.stats["hits"] + self.stats["misses"]
+        if lookups % STATS_EVERY == 0:
+            print(f"Semantic cache: {self.hit_rate():.1%} hit rate over {lookups} lookups, "
+                  f"{self.stats['evictions']} evictions")
+        return response
+
+    def store(self, namespace, prompt, response, vector=None):
+        if vector is None:
+            vector = embeddings.embed([prompt])[0]
+        now = time.time()
+        with self._lock:
+            if self.vectors is None:
+                self.vectors = np.zeros((self.max_entries, len(vector)), dtype=np.float32)
+            free = np.flatnonzero((self.namespaces == b"") | (self.expires_at <= now))
+            if len(free):
+                slot = int(free[0])
+            else:
+                slot = int(np.argmin(self.last_used))
+                self.stats["evictions"] += 1
+            self.vectors[slot] = vector
+            self.namespaces[slot] = namespace
+            self.expires_at[slot] = now + self.ttl_seconds
+            self.last_used[slot] = now
+            self.prompts[slot] = prompt
+            self.responses[slot] = response
+            self.stats["stores"] += 1
+
+    def hit_rate(self):
+        lookups = self.stats["hits"] + self.stats["misses"]
+        return self.stats["hits"] / lookups if lookups else 0.0
+
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+def get_semantic_cache(setting=SEMANTIC_CACHE):
+    """Process-wide semantic cache, or None when SEMANTIC_CACHE is off"""
+    global _cache
+    if setting not in ("1", "on", "true", "yes"):
+        return None
+    with _cache_lock:
+        if _cache is None:
+            _cache = SemanticCache()
+        return _cache
+
+
+# --- Cached calls ---
+def semantic_completion(cache, data, call):
+    """Return call(data), or the answer to an earlier prompt close enough in meaning"""
+    namespace, prompt = split_prompt(data) if cache is not None else (None, None)
+    if not prompt:
+        return call(data)
+    vector = embeddings.embed([prompt])[0]
+    cached = cache.lookup(namespace, prompt, vector)
+    if cached is not None:
+        return cached
+    response = call(data)
+    cache.store(namespace, prompt, response, vector)
+    return response
+
+
+def semantic_stream(cache, data, stream):
+    """Yield deltas from stream(), or replay the answer to a paraphrase of the prompt.
+
+    Like cached_stream, the answer is only stored once the stream finishes cleanly.
+    """
+    namespace, prompt = split_prompt(data) if cache is not None else (None, None)
+    if not prompt:
+        yield from stream()
+        return
+    vector = embeddings.embed([prompt])[0]
+    cached = cache.lookup(namespace, prompt, vector)
+    if cached is not None:
+        yield from replay(cached)
+        return
+    parts = []
+    for delta in stream():
+        parts.append(delta)
+        yield delta
+    if parts:
+        cache.store(namespace, prompt, "".join(parts), vector)
@@ -0,0 +1,307 @@
+# semantic_index.py
+# Embedding index over chat messages, stored as a flat memory-mapped matrix.
+#
+#   python -m chat_common.semantic_index --db chatbot_db             # embed chats written before the index existed
+#   python -m chat_common.semantic_index --db chatbot_db --compact   # drop deleted rows (stop the apps first)
+import os
+import re
+import json
+import time
+import argparse
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+from dotenv import load_dotenv
+from filelock import FileLock
+from chat_common import embeddings
+
+load_dotenv()
+
+# --- Configuration ---
+SEMANTIC_INDEX_DIR = os.getenv("SEMANTIC_INDEX_DIR", ".semantic_index")
+# float16 halves the size of float32 with no visible loss; int8 quarters it
+SEMANTIC_INDEX_DTYPE = os.getenv("SEMANTIC_INDEX_DTYPE", "float16").strip().lower()
+# Rows scored per matrix product, bounding the memory a search touches at once
+SEARCH_BLOCK_ROWS = 65536
+PREVIEW_CHARS = 200
+INT8_SCALE = 127.0
+
+
+class SemanticIndex:
+    """Append-only message vectors in one binary file, memory-mapped for search.
+
+    Each line of rows.jsonl describes one message and records the byte
+    offset of its vector in vectors.bin; a {"chat_id", "removed"} line drops
+    every earlier row of that chat. Several processes can share a directory:
+    appends happen under a file lock, and each process reads whatever the
+    others appended before it writes or searches. Vectors are unit length,
+    so a dot product is the cosine similarity; a search scores only the rows
+    of the chats it is given, in blocks, with one matrix product per block.
+    Each embedding model gets its own directory. Nothing is read (and no
+    model is loaded) until the first add or search.
+    """
+
+    def __init__(self, directory, dtype=SEMANTIC_INDEX_DTYPE):
+        if dtype not in ("float16", "int8"):
+            raise ValueError(f"SEMANTIC_INDEX_DTYPE must be float16 or int8, not {dtype}")
+        self.dtype = np.dtype(dtype)
+        self.base_directory = directory
+        self.directory = None
+        self.dim = None
+        self._reset()
+        self._lock = threading.RLock()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="semantic-index")
+
+    # --- Storage ---
+    def _load(self):
+        with self._lock:
+            if self.directory is None:
+                directory = os.path.join(self.base_directory, re.sub(r"[^\w.-]+", "_", embeddings.model_name()),
+                                         self.dtype.name)
+                os.makedirs(directory, exist_ok=True)
+                self.vectors_path = os.path.join(directory, "vectors.bin")
+                self.rows_path = os.path.join(directory, "rows.jsonl")
+                self._file_lock = FileLock(os.path.join(directory, "index.lock"))
+                meta_path = os.path.join(directory, "index.json")
+                with self._file_lock:
+                    if not os.path.exists(meta_path):
+                        with open(meta_path, "w", encoding="utf-8") as f:
+                            json.dump({"dim": embeddings.dimension(), "dtype": self.dtype.name,
+                                       "model": embeddings.model_name()}, f)
+                with open(meta_path, encoding="utf-8") as f:
+                    self.dim = json.load(f)["dim"]
+                self.row_bytes = self.dim * self.dtype.itemsize
+                self.directory = directory
+        self._sync()
+
+    def _reset(self):
+        self.rows = []
+        self.positions = []
+        self.rows_by_chat = {}
+        self.embedded = {}
+        self._rows_read = 0
+        self._rows_inode = None
+        self._matrix = None
+        self._matrix_key = None
+
+    def _sync(self):
+        """Apply the lines appended to rows.jsonl since the last call, by this or any other process"""
+        with self._lock:
+            try:
+                f = open(self.rows_path, "rb")
+            except FileNotFoundError:
+                return
+            with f:
+                stat = os.fstat(f.fileno())
+                if stat.st_ino != self._rows_inode or stat.st_size < self._rows_read:
+                    # Replaced by a compaction: start over
+                    self._reset()
+                    self._rows_inode = stat.st_ino
+                if stat.st_size == self._rows_read:
+                    return
+                f.seek(self._rows_read)
+                data = f.read(stat.st_size - self._rows_read)
+            # A line still being written (or cut off by a crash) is left for later
+            complete = data.rfind(b"\n") + 1
+            for line in data[:complete].splitlines():
+                try:
+                    self._apply(json.loads(line))
+                except ValueError:
+                    continue
+            self._rows_read += complete
+
+    def _apply(self, row):
+        chat_id = row["chat_id"]
+        if row.get("removed"):
+            self.rows_by_chat.pop(chat_id, None)
+            self.embedded.pop(chat_id, None)
+            return
+        self.rows_by_chat.setdefault(chat_id, []).append(len(self.rows))
+        self.rows.append(row)
+        self.positions.append(row["offset"] // self.row_bytes)
+        self.embedded[chat_id] = max(self.embedded.get(chat_id, 0), row["seq"] + 1)
+
+    def _encode(self, vectors):
+        if self.dtype == np.int8:
+            return np.clip(np.rint(vectors * INT8_SCALE), -127, 127).astype(np.int8)
+        return vectors.astype(np.float16)
+
+    def matrix(self):
+        """Every stored vector, remapped when the file has grown or been replaced"""
+        with self._lock:
+            try:
+                stat = os.stat(self.vectors_path)
+            except FileNotFoundError:
+                return None
+            key = (stat.st_ino, stat.st_size // self.row_bytes)
+            if key != self._matrix_key:
+                self._matrix = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                         shape=(key[1], self.dim)) if key[1] else None
+                self._matrix_key = key
+            return self._matrix
+
+    def _append(self, vectors, rows):
+        """Write vectors, then the rows pointing at them; caller holds the file lock"""
+        if vectors is not None and len(vectors):
+            with open(self.vectors_path, "ab") as f:
+                size = f.seek(0, os.SEEK_END)
+                # Bytes past the last whole row are from a write that crashed before its rows were logged
+                offset = size - size % self.row_bytes
+                if offset != size:
+                    f.truncate(offset)
+                f.write(vectors.tobytes())
+            for i, row in enumerate(rows):
+                row["offset"] = offset + i * self.row_bytes
+        with open(self.rows_path, "ab") as f:
+            # The leading newline ends any line a crashed writer left unfinished; blank lines are skipped
+            f.write(b"\n" + b"".join(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n" for row in rows))
+        self._sync()
+
+    # --- Writes ---
+    def add(self, chat_id, messages, start_seq=0):
+        """Embed messages numbered from start_seq, skipping the ones this chat already has"""
+        self._load()
+        skip = max(0, self.embedded.get(chat_id, 0) - start_seq)
+        new = [(start_seq + i, m) for i, m in enumerate(messages) if i >= skip and m.get("content", "").strip()]
+        if not new:
+            return 0
+        vectors = self._encode(embeddings.embed([m["content"] for _, m in new]))
+        with self._file_lock, self._lock:
+            # Another process may have indexed some of these while the model was busy
+            self._sync()
+            keep = [i for i, (seq, _) in enumerate(new) if seq >= self.embedded.get(chat_id, 0)]
+            if not keep:
+                return 0
+            rows = [{"chat_id": chat_id, "seq": new[i][0], "role": new[i][1].get("role"),
+                     "preview": " ".join(new[i][1]["content"].split())[:PREVIEW_CHARS]} for i in keep]
+            self._append(vectors[keep], rows)
+        return len(rows)
+
+    def remove(self, chat_id):
+        """Drop a chat's rows from searches; the bytes stay until compact()"""
+        self._load()
+        with self._file_lock, self._lock:
+            self._sync()
+            if chat_id in self.rows_by_chat:
+                self._append(None, [{"chat_id": chat_id, "removed": True}])
+
+    def replace(self, chat_id, messages):
+        """Re-index a chat whose history was rewritten rather than appended to"""
+        self.remove(chat_id)
+        return self.add(chat_id, messages)
+
+    def _submit(self, fn, chat_id, *args):
+        def run():
+            try:
+                fn(chat_id, *args)
+            except Exception as e:
+                print(f"Semantic indexing of chat {chat_id} failed: {e}")
+
+        self._executor.submit(run)
+
+    def schedule(self, chat_id, messages, start_seq=0, replace=False):
+        """Embed new turns in the background so the write path never waits for the model"""
+        messages = [{"role": m.get("role"), "content": m.get("content", "")} for m in messages]
+        if replace:
+            self._submit(self.replace, chat_id, messages)
+        else:
+            self._submit(self.add, chat_id, messages, start_seq)
+
+    def schedule_remove(self, chat_id):
+        self._submit(self.remove, chat_id)
+
+    def compact(self):
+        """Rewrite both files without removed rows; processes sharing the directory should be stopped"""
+        self._load()
+        with self._file_lock, self._lock:
+            self._sync()
+            live = sorted(i for rows in self.rows_by_chat.values() for i in rows)
+            matrix = self.matrix()
+            rows = [{k: v for k, v in self.rows[i].items() if k != "offset"} for i in live]
+            with open(self.vectors_path + ".tmp", "wb") as f:
+                for start in range(0, len(live), SEARCH_BLOCK_ROWS):
+                    block = [self.positions[i] for i in live[start:start + SEARCH_BLOCK_ROWS]]
+                    f.write(np.ascontiguousarray(matrix[block]).tobytes())
+            for i, row in enumerate(rows):
+                row["offset"] = i * self.row_bytes
+            with open(self.rows_path + ".tmp", "wb") as f:
+                f.writelines(json.dumps(row, ensure_ascii=False).encode("utf-8") + b"\n" for row in rows)
+            dropped = len(self.rows) - len(live)
+            self._matrix = None
+            os.replace(self.vectors_path + ".tmp", self.vectors_path)
+            os.replace(self.rows_path + ".tmp", self.rows_path)
+            self._sync()
+        return dropped
+
+    # --- Search ---
+    def search(self, query, chat_ids, limit=10):
+        """Best matching message per chat among chat_ids, highest cosine similarity first"""
+        self._load()
+        # Snapshot rows, positions and the mapped file together; a compaction may replace all three afterwards
+        with self._lock:
+            row_ids = [r for chat_id in chat_ids for r in self.rows_by_chat.get(chat_id, [])]
+            rows = [self.rows[r] for r in row_ids]
+            positions = np.array([self.positions[r] for r in row_ids], dtype=np.int64)
+            matrix = self.matrix()
+        if not rows or matrix is None:
+            return []
+        query_vector = embeddings.embed([query])[0].astype(np.float32)
+        scores = np.empty(len(rows), dtype=np.float32)
+        for start in range(0, len(rows), SEARCH_BLOCK_ROWS):
+            block = positions[start:start + SEARCH_BLOCK_ROWS]
+            scores[start:start + len(block)] = matrix[block].astype(np.float32) @ query_vector
+        if self.dtype == np.int8:
+            scores /= INT8_SCALE
+
+        best = {}
+        # Looking at a few times more rows than needed leaves room for several hits in one chat
+        top = min(len(rows), limit * 5)
+        for i in np.argpartition(-scores, top - 1)[:top]:
+            row = rows[i]
+            if row["chat_id"] not in best or scores[i] > best[row["chat_id"]]["score"]:
+                best[row["chat_id"]] = {**row, "score": float(scores[i])}
+        return sorted(best.values(), key=lambda hit: hit["score"], reverse=True)[:limit]
+
+
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_semantic_index(directory=SEMANTIC_INDEX_DIR):
+    """Process-wide index per directory, so it is loaded once and survives Streamlit reruns"""
+    with _indexes_lock:
+        if directory not in _indexes:
+            _indexes[directory] = SemanticIndex(directory)
+        return _indexes[directory]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Embed existing chat_sessions messages into the semantic index")
+    parser.add_argument("--db", default="chatbot_db")
+    parser.add_argument("--directory", default=SEMANTIC_INDEX_DIR)
+    parser.add_argument("--compact", action="store_true", help="drop rows of deleted or rewritten chats instead")
+    args = parser.parse_args()
+
+    index = get_semantic_index(os.path.join(args.directory, args.db))
+    if args.compact:
+        print(f"Compacted: {index.compact()} rows dropped")
+        return
+
+    from pymongo import MongoClient
+    mongo_uri = os.getenv("MONGO_URI")
+    if not mongo_uri:
+        raise ValueError("MONGO_URI not found in .env")
+    sessions = MongoClient(mongo_uri)[args.db].chat_sessions
+
+    started = time.perf_counter()
+    chats = added = 0
+    for chat in sessions.find({}, {"_id": 0, "chat_id": 1, "messages": 1}).batch_size(50):
+        added += index.add(chat["chat_id"], chat.get("messages") or [])
+        chats += 1
+        if chats % 100 == 0:
+            print(f"{chats} chats, {added} messages embedded ({time.perf_counter() - started:.1f}s)")
+    print(f"Done: {chats} chats, {added} messages embedded in {time.perf_counter() - started:.1f}s")
+
+
+if __name__ == "__main__":
+    main()
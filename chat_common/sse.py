@@ -0,0 +1,115 @@
+# sse.py
+import json
+
+try:
+    import orjson
+    loads = orjson.loads
+except ImportError:
+    loads = json.loads
+
+DONE = b"[DONE]"
+
+
+class SSEParser:
+    """Incremental server-sent events parser fed with raw byte chunks.
+
+    Lines may end in \\n or \\r\\n and may be split anywhere across reads.
+    Consecutive data: lines of one event are joined with a newline; comment,
+    event:, id: and retry: lines are skipped. A [DONE] event ends the stream.
+    """
+
+    def __init__(self):
+        self._buffer = bytearray()
+        self._data = []
+        self.done = False
+
+    def feed(self, chunk):
+        """Consume a chunk and return the payloads of every completed event"""
+        buf = self._buffer
+        if b"\n" not in chunk:
+            buf += chunk
+            return []
+        scan = len(buf)
+        buf += chunk
+        events = []
+        pos = 0
+        while not self.done:
+            end = buf.find(b"\n", max(pos, scan))
+            if end == -1:
+                break
+            line_end = end - 1 if end > pos and buf[end - 1] == 13 else end
+            if line_end == pos:
+                self._dispatch(events)
+            elif buf.startswith(b"data:", pos):
+                start = pos + 5
+                if start < line_end and buf[start] == 32:
+                    start += 1
+                self._data.append(bytes(buf[start:line_end]))
+            pos = end + 1
+        if pos:
+            del buf[:pos]
+        return events
+
+    def flush(self):
+        """Return the payload of a trailing event that was not terminated by a blank line"""
+        events = []
+        if self._buffer.startswith(b"data:"):
+            self.feed(b"\n")
+        self._dispatch(events)
+        return events
+
+    def _dispatch(self, events):
+        if not self._data:
+            return
+        payload = self._data[0] if len(self._data) == 1 else b"\n".join(self._data)
+        self._data = []
+        if payload == DONE:
+            self.done = True
+            return
+        events.append(payload)
+
+
+def iter_events(byte_chunks):
+    parser = SSEParser()
+    for chunk in byte_chunks:
+        yield from parser.feed(chunk)
+        if parser.done:
+            return
+    yield from parser.flush()
+
+
+async def aiter_events(byte_chunks):
+    parser = SSEParser()
+    async for chunk in byte_chunks:
+        for payload in parser.feed(chunk):
+            yield payload
+        if parser.done:
+            return
+    for payload in parser.flush():
+        yield payload
+
+
+def parse_chunk(payload):
+    try:
+        return loads(payload)
+    except ValueError:
+        return None
+
+
+def parse_delta(payload):
+    """Return (content, usage) for one completion chunk payload.
+
+    usage is only looked up when the raw bytes mention it, which is the
+    final chunk of a stream.
+    """
+    chunk = parse_chunk(payload)
+    if not chunk:
+        return None, None
+    content = None
+    choices = chunk.get("choices")
+    if choices:
+        delta = choices[0].get("delta")
+        if delta:
+            content = delta.get("content")
+    usage = chunk.get("usage") if b'"usage"' in payload else None
+    return content, usage
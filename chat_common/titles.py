@@ -0,0 +1,128 @@
+# titles.py
+import os
+import re
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# --- Configuration ---
+TITLE_WORKERS = int(os.getenv("TITLE_WORKERS", "4"))
+# Local titles scoring below this fall back to the model
+TITLE_MIN_SCORE = float(os.getenv("TITLE_MIN_SCORE", "0.6"))
+TITLE_MAX_WORDS = 6
+TITLE_MAX_CHARS = 50
+# Keywords a title needs for full confidence
+TITLE_GOOD_KEYWORDS = 3
+# Only the opening of a long message is looked at
+TITLE_SCAN_CHARS = 400
+
+STOP_WORDS = frozenset("""
+a about above after again against all also am an and any are as at be because been before being below
+between both but by can could did do does doing done down during each either else ever every few for from
+further get gets getting give go going got had has have having he her here hers herself him himself his how
+i if in into is it its itself just know let like make me might mine more most much must my myself need no
+nor not now of off on once one only or other our ours ourselves out over own please pls really same say
+see she should so some such tell than thank thanks that the their theirs them themselves then there these
+they thing things this those through to too try trying under until up upon us use used using very want
+vs wanna was way we well were what when where which while who whom whose why will with would yes yet you
+your yours yourself yourselves hi hello hey hii okay ok sure help explain show give write create
+""".split())
+
+_WORD = re.compile(r"[A-Za-z0-9][\w+#.'-]*")
+_SENTENCE_END = re.compile(r"[.?!\n]")
+
+_executor = ThreadPoolExecutor(max_workers=TITLE_WORKERS, thread_name_prefix="chat-title")
+_pending = set()
+_finished = {}
+_lock = threading.Lock()
+
+
+# --- Local titles ---
+def _weight(word):
+    # Longer words, names, acronyms and code-like tokens say more about the topic
+    weight = len(word)
+    if word[0].isupper() or any(c.isdigit() for c in word) or any(c in word for c in "_+#."):
+        weight += 3
+    return weight
+
+
+def _capitalize(word):
+    # Leave identifiers such as user_id or node.js as written
+    if not word.islower() or any(c in word for c in "_."):
+        return word
+    return word[0].upper() + word[1:]
+
+
+def extract_title(message):
+    """Build a title from the key words of a message; return (title, score between 0 and 1).
+
+    Stop words are dropped and the heaviest remaining words are kept in
+    their original order. A low score means the message said too little
+    (a greeting, a one-word question) and a model title is worth the call.
+    """
+    text = message[:TITLE_SCAN_CHARS]
+    # Prefer the first sentence when it carries enough on its own
+    end = _SENTENCE_END.search(text)
+    candidates = []
+    for scope in ((text[:end.start()], text) if end else (text,)):
+        seen = set()
+        candidates = []
+        for word in _WORD.findall(scope):
+            word = word.rstrip(".'-")
+            key = word.lower()
+            if len(key) < 2 or key in STOP_WORDS or key in seen:
+                continue
+            seen.add(key)
+            candidates.append(word)
+        if len(candidates) >= TITLE_GOOD_KEYWORDS:
+            break
+
+    if not candidates:
+        return "", 0.0
+    keep = set(sorted(range(len(candidates)), key=lambda i: (-_weight(candidates[i]), i))[:TITLE_MAX_WORDS])
+    words = [_capitalize(w) for i, w in enumerate(candidates) if i in keep]
+
+    title = ""
+    for word in words:
+        if len(title) + len(word) + 1 > TITLE_MAX_CHARS:
+            break
+        title = f"{title} {word}" if title else word
+    if not title:
+        title = words[0][:TITLE_MAX_CHARS]
+    return title, min(1.0, len(candidates) / TITLE_GOOD_KEYWORDS)
+
+
+# --- Background titling ---
+def schedule_title(chat_id, first_message, generate, save, owner=None):
+    """Generate a chat title in the background instead of blocking the page.
+
+    generate(first_message) returns the title and save(chat_id, title)
+    persists it. Finished chats are remembered per owner so the page can
+    reload its chat list once (see pop_finished). Returns True when a job
+    was scheduled.
+    """
+    with _lock:
+        if chat_id in _pending:
+            return False
+        _pending.add(chat_id)
+
+    def _title():
+        try:
+            title = generate(first_message)
+            if title:
+                save(chat_id, title)
+                with _lock:
+                    _finished.setdefault(owner, set()).add(chat_id)
+        except Exception as e:
+            print(f"Background title for chat {chat_id} failed: {e}")
+        finally:
+            with _lock:
+                _pending.discard(chat_id)
+
+    _executor.submit(_title)
+    return True
+
+
+def pop_finished(owner=None):
+    """Chat ids titled since the last call, so the sidebar knows to refresh"""
+    with _lock:
+        return _finished.pop(owner, set())
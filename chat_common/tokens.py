@@ -0,0 +1,96 @@
+# tokens.py
+import os
+import re
+from functools import lru_cache
+
+# --- Configuration ---
+# Optional Hugging Face tokenizer (e.g. deepseek-ai/DeepSeek-R1) for exact counts.
+# Without it, or without the tokenizers package, counts are estimated locally.
+TOKENIZER_NAME = os.getenv("TOKENIZER_NAME", "").strip()
+
+# Role markers and separators the chat template adds around each message
+MESSAGE_OVERHEAD_TOKENS = 4
+REPLY_PRIMING_TOKENS = 2
+
+_WORD_RE = re.compile(r"\w+|[^\w\s]")
+
+_tokenizer = None
+_tokenizer_loaded = False
+
+
+def get_tokenizer():
+    global _tokenizer, _tokenizer_loaded
+    if not _tokenizer_loaded:
+        _tokenizer_loaded = True
+        if TOKENIZER_NAME:
+            try:
+                from tokenizers import Tokenizer
+                _tokenizer = Tokenizer.from_pretrained(TOKENIZER_NAME)
+            except Exception as e:
+                print(f"Tokenizer {TOKENIZER_NAME} unavailable, estimating tokens instead: {e}")
+    return _tokenizer
+
+
+def estimate_tokens(text):
+    """BPE-style estimate: one token per punctuation mark, about four characters per word piece"""
+    return sum((len(piece) + 3) // 4 for piece in _WORD_RE.findall(text))
+
+
+@lru_cache(maxsize=8192)
+def count_tokens(text):
+    if not text:
+        return 0
+    tokenizer = get_tokenizer()
+    if tokenizer is not None:
+        return len(tokenizer.encode(text, add_special_tokens=False).ids)
+    return estimate_tokens(text)
+
+
+def count_message_tokens(message):
+    return count_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def count_messages_tokens(messages):
+    return sum(count_message_tokens(m) for m in messages) + REPLY_PRIMING_TOKENS
+
+
+class UsageMeter:
+    """Token accounting for one completion.
+
+    Prompt tokens are counted locally before the request is sent and
+    completion tokens as deltas arrive, so usage is known even when the
+    provider never reports it. Provider-reported numbers win when present.
+    """
+
+    def __init__(self, messages):
+        self.estimated_prompt_tokens = count_messages_tokens(messages)
+        self.estimated_completion_tokens = 0
+        self.reported_prompt_tokens = None
+        self.reported_completion_tokens = None
+
+    def add_delta(self, text):
+        # Provider deltas are mostly single tokens and repeat a lot, so the memoised count is cheap here
+        self.estimated_completion_tokens += count_tokens(text)
+
+    def add_usage(self, usage):
+        if not usage:
+            return
+        if usage.get("prompt_tokens") is not None:
+            self.reported_prompt_tokens = (self.reported_prompt_tokens or 0) + usage["prompt_tokens"]
+        if usage.get("completion_tokens") is not None:
+            self.reported_completion_tokens = (self.reported_completion_tokens or 0) + usage["completion_tokens"]
+
+    def totals(self):
+        prompt_tokens = self.reported_prompt_tokens
+        completion_tokens = self.reported_completion_tokens
+        estimated = prompt_tokens is None or completion_tokens is None
+        if prompt_tokens is None:
+            prompt_tokens = self.estimated_prompt_tokens
+        if completion_tokens is None:
+            completion_tokens = self.estimated_completion_tokens
+        return {
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens,
+            "estimated": estimated
+        }
@@ -0,0 +1,161 @@
+# write_behind.py
+import os
+import time
+import atexit
+import threading
+from collections import deque
+
+# --- Configuration ---
+# A batch is written once it holds this many documents or its oldest one has waited this long
+WRITE_BEHIND_MAX_BATCH = int(os.getenv("WRITE_BEHIND_MAX_BATCH", "100"))
+WRITE_BEHIND_FLUSH_SECONDS = float(os.getenv("WRITE_BEHIND_FLUSH_SECONDS", "0.5"))
+# Past this many queued documents insert() writes in the caller's thread instead of queueing more
+WRITE_BEHIND_MAX_PENDING = int(os.getenv("WRITE_BEHIND_MAX_PENDING", "10000"))
+# A document the server rejects this many times is moved to <collection>_dead_letter
+WRITE_BEHIND_MAX_ATTEMPTS = int(os.getenv("WRITE_BEHIND_MAX_ATTEMPTS", "5"))
+RETRY_SECONDS = 1.0
+
+DUPLICATE_KEY = 11000
+
+
+class WriteBehindBuffer:
+    """Queues inserts for one collection and writes them with insert_many from a background thread.
+
+    Documents keep the _id pymongo assigns on the first attempt, so a batch
+    retried after a timeout that actually succeeded only hits duplicate-key
+    errors, which count as written. A document rejected on its own (say a
+    validation error) is retried up to max_attempts times and then moved to
+    the dead-letter collection, so it cannot hold up the ones behind it;
+    failures of a whole batch (network, failover) are retried without limit.
+    close() writes whatever is left and is registered with atexit.
+    """
+
+    def __init__(self, collection, max_batch=WRITE_BEHIND_MAX_BATCH, flush_seconds=WRITE_BEHIND_FLUSH_SECONDS,
+                 max_pending=WRITE_BEHIND_MAX_PENDING, max_attempts=WRITE_BEHIND_MAX_ATTEMPTS, dead_letter=None):
+        self.collection = collection
+        self.max_batch = max_batch
+        self.flush_seconds = flush_seconds
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.dead_letter = dead_letter if dead_letter is not None else collection.database[f"{collection.name}_dead_letter"]
+        self.stats = {"queued": 0, "written": 0, "batches": 0, "failures": 0, "dead_lettered": 0}
+        self._attempts = {}
+        self._pending = deque()
+        self._changed = threading.Condition()
+        self._flush_lock = threading.Lock()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name=f"write-behind-{collection.name}", daemon=True)
+        self._thread.start()
+
+    def insert(self, document):
+        with self._changed:
+            closed = self._closed
+            if not closed:
+                self._pending.append(document)
+                self.stats["queued"] += 1
+                backlog = len(self._pending)
+                if backlog >= self.max_batch:
+                    self._changed.notify()
+        if closed:
+            self.collection.insert_one(document)
+        elif backlog >= self.max_pending:
+            # The database is falling behind; push back on the caller rather than grow without bound
+            self.flush()
+
+    def flush(self):
+        """Write everything queued so far; return False if a batch failed and was put back"""
+        with self._flush_lock:
+            while True:
+                with self._changed:
+                    batch = [self._pending.popleft() for _ in range(min(self.max_batch, len(self._pending)))]
+                if not batch:
+                    return True
+                failed = self._write(batch)
+                if failed:
+                    with self._changed:
+                        self._pending.extendleft(reversed(failed))
+                    return False
+
+    def _write(self, batch):
+        """Insert a batch; return the documents that still need writing"""
+        rejected = []
+        try:
+            self.collection.insert_many(batch, ordered=False)
+            failed = []
+        except Exception as e:
+            errors = getattr(e, "details", None) or {}
+            write_errors = errors.get("writeErrors")
+            if write_errors is None:
+                failed = batch
+            else:
+                rejected = [(batch[err["index"]], err) for err in write_errors if err.get("code") != DUPLICATE_KEY]
+                failed = [doc for doc, _ in rejected]
+            if failed:
+                self.stats["failures"] += 1
+                print(f"Write-behind to {self.collection.name} failed for {len(failed)} of {len(batch)} documents, will retry: {e}")
+        self.stats["batches"] += 1
+        self.stats["written"] += len(batch) - len(failed)
+        retry = {id(doc) for doc in failed}
+        for doc in batch:
+            if id(doc) not in retry:
+                self._attempts.pop(id(doc), None)
+        for doc, err in rejected:
+            attempts = self._attempts.get(id(doc), 0) + 1
+            if attempts < self.max_attempts:
+                self._attempts[id(doc)] = attempts
+                continue
+            self._attempts.pop(id(doc), None)
+            retry.discard(id(doc))
+            self._give_up(doc, err)
+        return [doc for doc in failed if id(doc) in retry]
+
+    def _give_up(self, doc, error):
+        self.stats["dead_lettered"] += 1
+        print(f"Write-behind to {self.collection.name} gave up on document {doc.get('_id')} after "
+              f"{self.max_attempts} attempts: {error.get('errmsg')}")
+        try:
+            self.dead_letter.insert_one({"document": doc, "error": error.get("errmsg"), "code": error.get("code")})
+        except Exception as e:
+            print(f"Dead-letter write for {self.collection.name} failed, dropping document {doc.get('_id')}: {e}")
+
+    def _run(self):
+        while True:
+            with self._changed:
+                self._changed.wait_for(lambda: self._closed or len(self._pending) >= self.max_batch,
+                                       timeout=self.flush_seconds)
+                if self._closed:
+                    return
+            if not self.flush():
+                time.sleep(RETRY_SECONDS)
+
+    def close(self):
+        with self._changed:
+            self._closed = True
+            self._changed.notify()
+        self._thread.join(timeout=5)
+        for _ in range(3):
+            if self.flush():
+                return
+            time.sleep(RETRY_SECONDS)
+        print(f"Write-behind to {self.collection.name} lost {len(self._pending)} documents at shutdown")
+
+
+_buffers = {}
+_buffers_lock = threading.Lock()
+
+
+def get_write_buffer(collection):
+    """Process-wide buffer per collection, so queued writes survive Streamlit reruns"""
+    with _buffers_lock:
+        if collection.full_name not in _buffers:
+            if not _buffers:
+                atexit.register(close_all)
+            _buffers[collection.full_name] = WriteBehindBuffer(collection)
+        return _buffers[collection.full_name]
+
+
+def close_all():
+    with _buffers_lock:
+        buffers = list(_buffers.values())
+    for buffer in buffers:
+        buffer.close()
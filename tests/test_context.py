@@ -0,0 +1,16 @@
+from chat_common.context import build_context
+from chat_common.memory import with_summary
+
+
+def test_summary_survives_an_over_budget_history():
+    messages = [{"role": "user" if i % 2 == 0 else "assistant", "content": f"turn {i} " + "word " * 200}
+                for i in range(40)]
+    pinned, history = with_summary(messages, "The user is planning a trip to Kyoto.", summarized_count=10)
+
+    request, stats = build_context("You are a helpful assistant.", history, budget=3000, pinned=pinned)
+
+    assert stats["dropped_messages"] > 0
+    assert stats["prompt_tokens"] <= 3000
+    assert request[0] == {"role": "system", "content": "You are a helpful assistant."}
+    assert request[1]["role"] == "system" and "Kyoto" in request[1]["content"]
+    assert request[-1]["content"] == messages[-1]["content"]
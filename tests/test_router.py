@@ -0,0 +1,57 @@
+import time
+import asyncio
+from chat_common import resilience, router
+
+URL = "http://router.test/v1/chat/completions"
+
+
+def _route(models, open_stream):
+    async def collect():
+        return [item async for item in router.route_stream(models, open_stream, stall_seconds=0.05, url=URL)]
+    return asyncio.run(collect())
+
+
+def test_stalled_model_comes_back_after_reset_timeout():
+    breaker = resilience.get_breaker(router.breaker_name(URL, "slow"))
+    breaker.failure_threshold = 1
+    breaker.reset_seconds = 0.2
+    stalling = {"slow": True}
+
+    def open_model_stream(model, last):
+        async def answer():
+            if model == "slow" and stalling["slow"]:
+                await asyncio.sleep(3600)
+            yield model
+        return resilience.resilient_stream(answer, name=router.breaker_name(URL, model), max_retries=0)
+
+    # The stall fails over and opens the slow model's breaker
+    assert _route(["slow", "fast"], open_model_stream) == ["fast"]
+    assert breaker.state == "open"
+
+    # Half-open probe stalls again and is cancelled: the breaker reopens instead of wedging
+    time.sleep(0.25)
+    assert _route(["slow", "fast"], open_model_stream) == ["fast"]
+    assert breaker.state == "open" and not breaker.probing
+
+    # Once it answers again, the next probe goes through and closes the breaker
+    stalling["slow"] = False
+    time.sleep(0.25)
+    assert _route(["slow", "fast"], open_model_stream) == ["slow"]
+    assert breaker.state == "closed"
+
+
+def test_single_model_is_not_cut_off_by_the_stall_timeout():
+    breaker = resilience.get_breaker(router.breaker_name(URL, "only"))
+    retries = []
+
+    def open_model_stream(model, last):
+        async def answer():
+            await asyncio.sleep(0.15)
+            yield model
+        retries.append(resilience.MAX_RETRIES if last else router.RETRIES_PER_MODEL)
+        return resilience.resilient_stream(answer, name=router.breaker_name(URL, model), max_retries=retries[-1])
+
+    # Slower than the 0.05s stall window, but there is nothing to fail over to
+    assert _route(["only"], open_model_stream) == ["only"]
+    assert retries == [resilience.MAX_RETRIES]
+    assert breaker.state == "closed" and breaker.failures == 0
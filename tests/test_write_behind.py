@@ -0,0 +1,42 @@
+from pymongo.errors import BulkWriteError
+from chat_common import write_behind
+from chat_common.write_behind import WriteBehindBuffer
+
+
+class FakeCollection:
+    """insert_many that rejects documents marked bad, the way a validator would"""
+
+    name = "messages"
+
+    def __init__(self):
+        self.documents = []
+
+    def insert_many(self, documents, ordered=True):
+        errors = []
+        for i, doc in enumerate(documents):
+            if doc.get("bad"):
+                errors.append({"index": i, "code": 121, "errmsg": "Document failed validation"})
+            else:
+                self.documents.append(doc)
+        if errors:
+            raise BulkWriteError({"writeErrors": errors})
+
+    def insert_one(self, document):
+        self.documents.append(document)
+
+
+def test_rejected_document_does_not_block_later_ones(monkeypatch):
+    monkeypatch.setattr(write_behind, "RETRY_SECONDS", 0.01)
+    collection, dead_letter = FakeCollection(), FakeCollection()
+    buffer = WriteBehindBuffer(collection, max_batch=100, flush_seconds=60, max_attempts=3, dead_letter=dead_letter)
+
+    buffer.insert({"text": "before"})
+    buffer.insert({"text": "broken", "bad": True})
+    for attempt in range(3):
+        buffer.insert({"text": f"after {attempt}"})
+        buffer.flush()
+    buffer.close()
+
+    assert [d["text"] for d in collection.documents] == ["before", "after 0", "after 1", "after 2"]
+    assert [d["document"]["text"] for d in dead_letter.documents] == ["broken"]
+    assert buffer.stats["dead_lettered"] == 1